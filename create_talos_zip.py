@@ -120,6 +120,10 @@ httplib2_files = ['__init__.py',
 httplib2_oauth2 = [('%s/%s' % (httplib2_src, f), 'oauth2/httplib2/%s' % f)
                    for f in httplib2_files]
 
+# numpy, which talos uses if present to parse and filter results in bulk,
+# is a compiled extension and cannot be shipped in the zip; install it
+# into the python which runs talos to use it
+
 # all dependencies
 manifest = mozhttpd + mozinfo + mozcrash + mozfile + mozlog + mozdevice + datazilla_client + yaml + simplejson + oauth2 + httplib2_oauth2
 manifest = [(url, destination.replace('/', os.path.sep)) for url, destination in manifest]
@@ -23,6 +23,11 @@ dependencies = ['PyYAML',
                 ]
 dependency_links = []
 
+# numpy is optional: with it, results are parsed and filtered in bulk
+# (see talos/filter.py apply_batch); install with `pip install talos[numpy]`
+# or by installing numpy into the python running talos
+extras = {'numpy': ['numpy']}
+
 try:
     import json
 except ImportError:
@@ -59,6 +64,7 @@ setup(name='talos',
                            ]},
       zip_safe=False,
       install_requires=dependencies,
+      extras_require=extras,
       dependency_links=dependency_links,
       entry_points="""
       # -*- Entry points: -*-
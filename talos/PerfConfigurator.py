@@ -111,6 +111,14 @@ the highest value.
                      'flags': ['--filter']}),
         ('cycles', {'help': 'number of browser cycles to run',
                     'type': int}),
+        ('converge_threshold', {'help': """stop running browser cycles once the confidence interval
+of the result is narrower than this fraction of it (e.g. 0.02);
+no more than --cycles are run""",
+                                'type': float,
+                                'flags': ['--convergeThreshold']}),
+        ('min_cycles', {'help': 'minimum number of browser cycles to run with --convergeThreshold [DEFAULT: 5]',
+                        'type': int,
+                        'flags': ['--minCycles']}),
         ('tpmanifest', {'help': 'manifest file to test'}),
         ('tpcycles', {'help': 'number of pageloader cycles to run',
                       'type': int}),
@@ -272,6 +280,8 @@ the highest value.
 
     # keys to generated self.config that are global overrides to tests
     global_overrides = ['cycles',
+                        'converge_threshold',
+                        'min_cycles',
                         'responsiveness',
                         'rss',
                         'shutdown',
@@ -787,6 +797,7 @@ the highest value.
                     'process': '',
                     'remote': False,
                     'fennecIDs': '',
+                    'filters': [],
                     'repository': 'NULL',
                     'sourcestamp': 'NULL',
                     'symbols_path': None,
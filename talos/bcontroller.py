@@ -13,6 +13,7 @@ import threading
 import sys
 import utils
 import optparse
+import wait
 
 from utils import talosError
 
@@ -39,9 +40,10 @@ defaults = {'endTime': -1,
 
 class BrowserWaiter(threading.Thread):
 
-  def __init__(self, remoteProcess=None, **options):
+  def __init__(self, remoteProcess=None, notify=None, **options):
       self.options = options
       self.remoteProcess = remoteProcess
+      self.notify = notify # write end of a pipe to signal completion on
       for key, value in defaults.items():
           setattr(self, key, options.get(key, value))
 
@@ -123,6 +125,12 @@ class BrowserWaiter(threading.Thread):
       self.returncode = os.system(self.command + " > " + self.browser_log)
 
     self.endTime = int(time.time()*1000)
+    if self.notify is not None:
+      try:
+        os.write(self.notify, '.')
+      except OSError:
+        pass # the controller has stopped waiting
+      os.close(self.notify)
 
   def hasTime(self):
     return self.endTime > -1
@@ -159,32 +167,37 @@ class BrowserController(object):
         self.command = ' "%s" %s' % (self.env, self.command)
         options['command'] = self.command
   def run(self):
-    self.bwaiter = BrowserWaiter(self.remoteProcess, **self.options)
-    noise = 0
+    # wake on browser output and on completion, where supported;
+    # otherwise this polls the log once a second
+    waiter = wait.Waiter()
+    waiter.watch_file(self.browser_log)
+    self.bwaiter = BrowserWaiter(self.remoteProcess, notify=waiter.pipe(), **self.options)
     prev_size = 0
-    while not self.bwaiter.hasTime():
-      if noise > self.test_timeout: # check for frozen browser
+    last_output = time.time()
+    try:
+      while not self.bwaiter.hasTime():
+        if time.time() - last_output > self.test_timeout: # check for frozen browser
+          try:
+            if os.path.isfile(self.browser_log):
+              os.chmod(self.browser_log, 0777)
+            results_file = open(self.browser_log, "a")
+            results_file.write("\n__FAILbrowser frozen__FAIL\n")
+            results_file.close()
+          except IOError, e:
+            raise talosError(str(e))
+          return
+        waiter.wait(1)
         try:
-          if os.path.isfile(self.browser_log):
-            os.chmod(self.browser_log, 0777)
-          results_file = open(self.browser_log, "a")
-          results_file.write("\n__FAILbrowser frozen__FAIL\n")
-          results_file.close()
-        except IOError, e:
-          raise talosError(str(e))
-        return
-      time.sleep(1)
-      try:
-        open(self.browser_log, "r").close() #HACK FOR WINDOWS: refresh the file information
-        size = os.path.getsize(self.browser_log)
-      except:
-        size = 0
-
-      if size > prev_size:
-        prev_size = size
-        noise = 0
-      else:
-        noise += 1
+          open(self.browser_log, "r").close() #HACK FOR WINDOWS: refresh the file information
+          size = os.path.getsize(self.browser_log)
+        except:
+          size = 0
+
+        if size > prev_size:
+          prev_size = size
+          last_output = time.time()
+    finally:
+      waiter.close()
 
     results_file = open(self.browser_log, "a")
     if self.bwaiter.getReturn() != 0:  #the browser shutdown, but not cleanly
@@ -2,10 +2,108 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
+import sys
+import threading
+import utils
+from array import array
+
+NaN = float('nan') # timestamp of values not sampled by the monitor
+
+def is_integer(value):
+  return isinstance(value, (int, long))
+
+class CounterSeries(object):
+  """The values of a counter and the times they were sampled at, stored in
+     arrays of doubles rather than lists of python floats.
+     Like a list, a series iterates over and indexes its values.
+     Whether all the values were integers is remembered, so that counters
+     such as RSS are serialized as integers.
+  """
+
+  def __init__(self, values=(), timestamps=None, integral=None):
+    if integral is None:
+      values = list(values)
+      integral = not [value for value in values if not is_integer(value)]
+    self.integral = integral
+    self.values = array('d', values)
+    if timestamps is None:
+      timestamps = [NaN] * len(self.values)
+    self.timestamps = array('d', timestamps)
+
+  def __len__(self):
+    return len(self.values)
+
+  def __iter__(self):
+    return iter(self.values)
+
+  def __getitem__(self, index):
+    return self.values[index]
+
+  def append(self, value, timestamp=NaN):
+    if not is_integer(value):
+      self.integral = False
+    self.values.append(float(value))
+    self.timestamps.append(timestamp)
+
+  def extend(self, values):
+    for value in values:
+      self.append(value)
+
+  def samples(self):
+    """returns a list of (timestamp, value)"""
+    return zip(self.timestamps, self.values)
+
+  def write_graphserver(self, buffer):
+    """writes the values as the lines of a graphserver VALUES block"""
+    for index, value in enumerate(self.values):
+      buffer.write("%d,%.2f,NULL\n" % (index, value))
+
+  def datazilla(self):
+    """returns the values as a list for datazilla's talos_aux"""
+    if self.integral:
+      return [int(value) for value in self.values]
+    return self.values.tolist()
+
+
+class RingBuffer(object):
+  """A preallocated buffer of (timestamp, value) samples.
+     Once full, new samples overwrite the oldest ones.
+  """
+
+  def __init__(self, size):
+    self.size = size
+    self.times = array('d', [0.0]) * size
+    self.values = array('d', [0.0]) * size
+    self.count = 0 # samples appended, including overwritten ones
+    self.integral = True # whether all the values appended were integers
+
+  def __len__(self):
+    return min(self.count, self.size)
+
+  def append(self, timestamp, value):
+    if not is_integer(value):
+      self.integral = False
+    index = self.count % self.size
+    self.times[index] = timestamp
+    self.values[index] = value
+    self.count += 1
+
+  def series(self):
+    """returns the samples as a CounterSeries, oldest first"""
+    if self.count <= self.size:
+      return CounterSeries(self.values[:self.count], self.times[:self.count], self.integral)
+    start = self.count % self.size
+    return CounterSeries(self.values[start:] + self.values[:start],
+                         self.times[start:] + self.times[:start], self.integral)
+
+
 class CounterManager(object):
 
   counterDict = {}
 
+  # default seconds between samples taken by the monitor thread
+  pollInterval = .25
+
   def __init__(self, ffprocess, process, counters=None, childProcess="plugin-container"):
     self.allCounters = {}
     self.registeredCounters = {}
@@ -41,6 +139,63 @@ class CounterManager(object):
   def updatePidList(self):
     """Updates the list of PIDs we're interested in"""
 
-  def stopMonitor(self):
-    """any final cleanup"""
+  def sample_all(self):
+    """Returns {counter: value} for all the registered counters"""
+    return dict([(counter, self.getCounterValue(counter))
+                 for counter in self.registeredCounters])
+
+  def startMonitor(self, interval=None, size=4096):
+    """Starts sampling the registered counters every interval seconds
+       (by default, pollInterval) on a background thread.
+       The last size samples of each counter are kept.
+    """
+    if interval is None:
+      interval = self.pollInterval
+    self.interval = interval
+    self.samples = dict([(counter, RingBuffer(size))
+                         for counter in self.registeredCounters])
+    self.stopEvent = threading.Event()
+    self.monitorError = None # exc_info of an error raised while sampling
+    self.monitorThread = threading.Thread(target=self._monitor)
+    self.monitorThread.setDaemon(True)
+    self.monitorThread.start()
 
+  def _monitor(self):
+    """sample the counters at a fixed rate until stopMonitor is called;
+       an error stops the sampling, and is raised by stopMonitor"""
+    start = next = utils.monotonic()
+    while not self.stopEvent.isSet():
+      now = utils.monotonic()
+      if now < next:
+        self.stopEvent.wait(next - now)
+        continue
+      try:
+        values = self.sample_all()
+      except:
+        self.monitorError = sys.exc_info()
+        utils.info("Error sampling counters: %s", self.monitorError[1])
+        return
+      for counter, samples in self.samples.items():
+        value = values.get(counter)
+        if value is not None:
+          samples.append(now - start, value)
+      # keep to the schedule, skipping any ticks that sampling overran
+      next += self.interval
+      if next <= now:
+        next += self.interval * (int((now - next) / self.interval) + 1)
+
+  def stopMonitor(self):
+    """Stops the monitor thread, if running, and returns the samples taken
+       as {counter: CounterSeries}, timestamped in seconds since startMonitor.
+       Raises the error which stopped the sampling, if any.
+    """
+    if getattr(self, 'monitorThread', None) is not None:
+      self.stopEvent.set()
+      self.monitorThread.join()
+      self.monitorThread = None
+      if self.monitorError is not None:
+        exc_type, exc_value, exc_traceback = self.monitorError
+        self.monitorError = None
+        raise exc_type, exc_value, exc_traceback
+    return dict([(counter, samples.series())
+                 for counter, samples in getattr(self, 'samples', {}).items()])
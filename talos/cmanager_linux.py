@@ -2,11 +2,57 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
+import atexit
 import os
 import re
 import subprocess
 import sys
+import threading
+import utils
 from cmanager import CounterManager
+from distutils.spawn import find_executable
+
+
+class XrestopParser(object):
+  """
+  parses the output of `xrestop -b` a line at a time.
+  In batch mode xrestop prints a frame of all the X clients every
+  update; the client indices restart at 0 with each frame.
+  """
+
+  process_regex = re.compile(r'([0-9]+) - (.*) \( PID: *(.*) *\):')
+
+  def __init__(self):
+    self.clients = {} # pid -> client data, of the frame being parsed
+    self.frame = None # clients of the last complete frame
+    self.index = None # index of the last client
+    self.pid = None
+
+  def feed(self, line):
+    """parses a line of output; returns True if it starts a new frame"""
+    line = line.rstrip()
+    match = self.process_regex.match(line)
+    if match:
+      index, name, pid = match.groups()
+      index = int(index)
+      new_frame = self.index is not None and index <= self.index
+      if new_frame:
+        self.frame = self.clients
+        self.clients = {}
+      self.index = index
+      try:
+        self.pid = int(pid)
+      except ValueError:
+        # ignore processes without PIDs
+        self.pid = None
+        return new_frame
+      self.clients[self.pid] = dict(index=index, name=name)
+      return new_frame
+
+    if self.pid is not None and ':' in line:
+      counter, value = line.split(':', 1)
+      self.clients[self.pid][counter.strip()] = value.strip()
+    return False
 
 
 def xrestop(binary='xrestop'):
@@ -34,8 +80,6 @@ def xrestop(binary='xrestop'):
 	total bytes   : ~4728761
     """
 
-    process_regex = re.compile(r'([0-9]+) - (.*) \( PID: *(.*) *\):')
-
     args = ['-m', '1', '-b']
     command = [binary] + args
     process = subprocess.Popen(command,
@@ -45,36 +89,244 @@ def xrestop(binary='xrestop'):
         raise Exception("Unexpected error executing '%s':\n%s" % (subprocess.list2cmdline(command), stdout))
 
     # process output
-    retval = {}
-    index = name = pid = None
+    parser = XrestopParser()
     for line in stdout.strip().splitlines():
-        line = line.rstrip()
-        match = process_regex.match(line)
-        if match:
-            index, name, pid = match.groups()
-            try:
-                pid = int(pid)
-            except ValueError:
-                # ignore processes without PIDs
-                index = name = pid = None
-                continue
-            index = int(index)
-            retval[pid] = dict(index=index, name=name)
-        else:
-            if not pid:
-                continue
-            counter, value = line.split(':', 1)
-            counter = counter.strip()
-            value = value.strip()
-            retval[pid][counter] = value
-
-    return retval
-
-
-def GetPrivateBytes(pids):
+        parser.feed(line)
+    return parser.clients
+
+
+class XrestopReader(object):
+  """
+  Keeps `xrestop -b` running and parses its frames as they arrive, so that
+  the latest X resource usage can be read without forking xrestop.
+  """
+
+  def __init__(self, binary='xrestop', delay=1):
+    # -t is the delay between updates; -d would be the X display
+    command = [binary, '-b', '-t', str(delay)]
+    stdbuf = find_executable('stdbuf')
+    if stdbuf:
+      # line buffer xrestop's output so that frames arrive as printed
+      command = [stdbuf, '-oL'] + command
+    self.command = command
+    devnull = open(os.devnull, 'w')
+    try:
+      self.process = subprocess.Popen(command, stdout=subprocess.PIPE,
+                                      stderr=devnull)
+    finally:
+      # xrestop has its own copy
+      devnull.close()
+    self.frame = None
+    self.frameEvent = threading.Event()
+    self.thread = threading.Thread(target=self._read)
+    self.thread.setDaemon(True)
+    self.thread.start()
+
+  def _read(self):
+    parser = XrestopParser()
+    try:
+      for line in iter(self.process.stdout.readline, ''):
+        if parser.feed(line):
+          self.frame = parser.frame
+          self.frameEvent.set()
+    finally:
+      # xrestop has exited; don't leave anyone waiting for a frame
+      self.frameEvent.set()
+
+  def running(self):
+    return self.process.poll() is None
+
+  def clients(self, timeout=10):
+    """returns {pid: client data} from the latest complete frame"""
+    self.frameEvent.wait(timeout)
+    if self.frame is None:
+      raise Exception("No output from '%s'" % subprocess.list2cmdline(self.command))
+    return self.frame
+
+  def stop(self):
+    if self.running():
+      self.process.terminate()
+      self.process.wait()
+
+
+_xrestop_reader = None
+
+def _stop_xrestop_reader():
+  if _xrestop_reader is not None:
+    _xrestop_reader.stop()
+atexit.register(_stop_xrestop_reader)
+
+
+try:
+  PAGESIZE = os.sysconf('SC_PAGE_SIZE')
+  CLK_TCK = os.sysconf('SC_CLK_TCK')
+except (AttributeError, ValueError):
+  # not on linux
+  PAGESIZE = 4096
+  CLK_TCK = 100
+
+def _kernel_version():
+  """returns the (major, minor) version of the running kernel"""
+  try:
+    return tuple([int(i) for i in os.uname()[2].split('.')[:2]])
+  except (AttributeError, ValueError):
+    return (0, 0)
+
+# since Linux 4.5 the data field of /proc/<pid>/statm counts exactly the
+# private, writeable mappings (VmData + VmStk) that GetPrivateBytes sums up
+statm_private = _kernel_version() >= (4, 5)
+
+
+class ProcFiles(object):
+  """Keeps /proc/<pid>/* files open between samples, so reading one is a
+     seek and a read rather than an open, read and close.
+     Also keeps the previous readings of counters that report rates.
+     Between begin() and end(), each file is read at most once.
+  """
+
+  def __init__(self):
+    self.fds = {} # (pid, name) -> file descriptor
+    self.last = {} # counter -> (time, {pid: reading})
+    self.cache = None # (pid, name) -> contents, while sampling all counters
+
+  def begin(self):
+    self.cache = {}
+
+  def end(self):
+    self.cache = None
+
+  def read(self, pid, name, size=4096):
+    key = (pid, name)
+    if self.cache is not None and key in self.cache:
+      return self.cache[key]
+    fd = self.fds.get(key)
+    try:
+      if fd is None:
+        fd = self.fds[key] = os.open('/proc/%s/%s' % key, os.O_RDONLY)
+      os.lseek(fd, 0, os.SEEK_SET)
+      data = os.read(fd, size)
+    except OSError:
+      # the process has probably exited
+      self._close(key)
+      raise
+    if self.cache is not None:
+      self.cache[key] = data
+    return data
+
+  def _close(self, key):
+    fd = self.fds.pop(key, None)
+    if fd is not None:
+      os.close(fd)
+
+  def prune(self, pids):
+    """close the files of processes no longer in pids"""
+    for key in self.fds.keys():
+      if key[0] not in pids:
+        self._close(key)
+
+  def close(self):
+    for key in self.fds.keys():
+      self._close(key)
+
+
+def _statm(pid, procfiles=None):
+  """returns the fields of /proc/<pid>/statm, in pages"""
+  if procfiles is None:
+    f = open('/proc/%s/statm' % pid)
+    data = f.read()
+    f.close()
+  else:
+    data = procfiles.read(pid, 'statm')
+  return [int(i) for i in data.split()]
+
+
+def _stat(pid, procfiles):
+  """returns the fields of /proc/<pid>/stat after the command name,
+     so that field n of proc(5) is at index n - 3"""
+  data = procfiles.read(pid, 'stat')
+  return data[data.rindex(')') + 2:].split()
+
+
+def _field(pid, procfiles, name, key):
+  """returns the value of key in a 'key: value' file such as /proc/<pid>/io"""
+  for line in procfiles.read(pid, name).splitlines():
+    if line.startswith(key + ':'):
+      return int(line.split()[1])
+  raise KeyError("%s not found in /proc/%s/%s" % (key, pid, name))
+
+
+def _rate(procfiles, counter, readings):
+  """returns the per-second rate of change of the cumulative readings,
+     {pid: reading}, since the previous sample of counter, or None for the
+     first sample.  Processes that are new count from their first reading.
+  """
+  now = utils.monotonic()
+  last = procfiles.last.get(counter)
+  procfiles.last[counter] = (now, readings)
+  if last is None or now <= last[0]:
+    return None
+  then, previous = last
+  delta = sum([reading - previous.get(pid, reading)
+               for pid, reading in readings.items()])
+  return delta / (now - then)
+
+
+def GetCPUPercent(pids, procfiles):
+  """Percentage of one CPU used (user and system time) since the last sample"""
+  ticks = {}
+  for pid in pids:
+    stat = _stat(pid, procfiles)
+    ticks[pid] = int(stat[11]) + int(stat[12]) # utime + stime
+  rate = _rate(procfiles, 'cpu', ticks)
+  if rate is not None:
+    return 100. * rate / CLK_TCK
+
+
+def GetMinorFaults(pids, procfiles):
+  """Minor page faults per second since the last sample"""
+  return _rate(procfiles, 'minflt',
+               dict([(pid, int(_stat(pid, procfiles)[7])) for pid in pids]))
+
+
+def GetMajorFaults(pids, procfiles):
+  """Major page faults per second since the last sample"""
+  return _rate(procfiles, 'majflt',
+               dict([(pid, int(_stat(pid, procfiles)[9])) for pid in pids]))
+
+
+def GetVoluntaryContextSwitches(pids, procfiles):
+  """Voluntary context switches per second since the last sample"""
+  return _rate(procfiles, 'vcsw',
+               dict([(pid, _field(pid, procfiles, 'status', 'voluntary_ctxt_switches'))
+                     for pid in pids]))
+
+
+def GetInvoluntaryContextSwitches(pids, procfiles):
+  """Involuntary context switches per second since the last sample"""
+  return _rate(procfiles, 'ivcsw',
+               dict([(pid, _field(pid, procfiles, 'status', 'nonvoluntary_ctxt_switches'))
+                     for pid in pids]))
+
+
+def GetReadBytes(pids, procfiles):
+  """Bytes per second fetched from storage since the last sample"""
+  return _rate(procfiles, 'read_bytes',
+               dict([(pid, _field(pid, procfiles, 'io', 'read_bytes')) for pid in pids]))
+
+
+def GetWriteBytes(pids, procfiles):
+  """Bytes per second sent to storage since the last sample"""
+  return _rate(procfiles, 'write_bytes',
+               dict([(pid, _field(pid, procfiles, 'io', 'write_bytes')) for pid in pids]))
+
+
+def GetPrivateBytes(pids, procfiles=None):
   """Calculate the amount of private, writeable memory allocated to a process.
      This code was adapted from 'pmap.c', part of the procps project.
   """
+  if statm_private:
+    return sum([_statm(pid, procfiles)[5] for pid in pids]) * PAGESIZE
+
   privateBytes = 0
   for pid in pids:
     mapfile = '/proc/%s/maps' % pid
@@ -101,30 +353,20 @@ def GetPrivateBytes(pids):
   return privateBytes
 
 
-def GetResidentSize(pids):
+def GetResidentSize(pids, procfiles=None):
   """Retrieve the current resident memory for a given process"""
   # for some reason /proc/PID/stat doesn't give accurate information
-  # so we use status instead
-
-  RSS = 0
-  for pid in pids:
-    file = '/proc/%s/status' % pid
-
-    status = open(file)
+  # so we use statm, which matches VmRSS in /proc/PID/status
+  return sum([_statm(pid, procfiles)[1] for pid in pids]) * PAGESIZE
 
-    for line in status:
-      if line.find("VmRSS") >= 0:
-        RSS += int(line.split()[1]) * 1024
 
-    status.close()
-
-  return RSS
-
-
-def GetXRes(pids):
+def GetXRes(pids, procfiles=None):
   """Returns the total bytes used by X or raises an error if total bytes is not available"""
+  global _xrestop_reader
+  if _xrestop_reader is None or not _xrestop_reader.running():
+    _xrestop_reader = XrestopReader()
   XRes = 0
-  xres_output = xrestop()
+  xres_output = _xrestop_reader.clients()
   for pid in pids:
     if pid in xres_output:
       data = xres_output[pid]['total bytes']
@@ -151,10 +393,18 @@ class LinuxCounterManager(CounterManager):
 
   counterDict = {"Private Bytes": GetPrivateBytes,
                  "RSS": GetResidentSize,
-                 "XRes": GetXRes}
+                 "XRes": GetXRes,
+                 "% Processor Time": GetCPUPercent,
+                 "Voluntary Context Switches": GetVoluntaryContextSwitches,
+                 "Involuntary Context Switches": GetInvoluntaryContextSwitches,
+                 "Minor Faults": GetMinorFaults,
+                 "Major Faults": GetMajorFaults,
+                 "Read Bytes": GetReadBytes,
+                 "Write Bytes": GetWriteBytes}
 
 
-  pollInterval = .25
+  # seconds for which counters sampled together share a process table
+  processTableTTL = .1
 
   def __init__(self, ffprocess, process, counters=None, childProcess="plugin-container"):
     """Args:
@@ -165,8 +415,8 @@ class LinuxCounterManager(CounterManager):
     CounterManager.__init__(self, ffprocess, process, counters)
 
     self.childProcess = childProcess
-    self.runThread = False
     self.pidList = []
+    self.procFiles = ProcFiles()
     self.primaryPid = self.ffprocess._GetPidsByName(process)[-1]
     os.stat('/proc/%s' % self.primaryPid)
 
@@ -177,23 +427,42 @@ class LinuxCounterManager(CounterManager):
     """Returns the last value of the counter 'counterName'"""
     try:
       self.updatePidList()
-      return self.registeredCounters[counterName][0](self.pidList)
+      return self.registeredCounters[counterName][0](self.pidList, self.procFiles)
     except:
       return None
 
+  def sample_all(self):
+    """Returns {counter: value} for all the registered counters, refreshing
+       the pid list once and reading each /proc file once"""
+    values = {}
+    self.updatePidList()
+    self.procFiles.begin()
+    try:
+      for counter, (function, _) in self.registeredCounters.items():
+        try:
+          values[counter] = function(self.pidList, self.procFiles)
+        except:
+          values[counter] = None
+    finally:
+      self.procFiles.end()
+    return values
+
   def updatePidList(self):
     """Updates the list of PIDs we're interested in"""
     try:
       self.pidList = [self.primaryPid]
-      childPids = self.ffprocess._GetPidsByName(self.childProcess)
+      childPids = self.ffprocess._GetPidsByName(self.childProcess, ttl=self.processTableTTL)
       for pid in childPids:
         os.stat('/proc/%s' % pid)
         self.pidList.append(pid)
+      self.procFiles.prune(self.pidList)
     except:
       print "WARNING: problem updating child PID's"
 
   def stopMonitor(self):
     """any final cleanup"""
-    # TODO: should probably wait until we know run() is completely stopped
-    # before setting self.pid to None. Use a lock?
+    try:
+      return CounterManager.stopMonitor(self)
+    finally:
+      self.procFiles.close()
 
@@ -201,12 +201,16 @@ class WinCounterManager(CounterManager):
                                          byref(dwType), byref(value)) == 0:
         aggregateValue += value.union.longValue
 
-    return aggregateValue
+    # zero has always meant that no value could be collected
+    return aggregateValue or None
 
   def stopMonitor(self):
-    for counter in self.registeredCounters:
-      for singleCounter in self.registeredCounters[counter][1]:
-        pdh.PdhRemoveCounter(singleCounter[0])
-      pdh.PdhCloseQuery(self.registeredCounters[counter][0])
-    self.registeredCounters.clear()
+    try:
+      return CounterManager.stopMonitor(self)
+    finally:
+      for counter in self.registeredCounters:
+        for singleCounter in self.registeredCounters[counter][1]:
+          pdh.PdhRemoveCounter(singleCounter[0])
+        pdh.PdhCloseQuery(self.registeredCounters[counter][0])
+      self.registeredCounters.clear()
 
@@ -9,6 +9,7 @@ import shutil
 import sys
 import time
 import utils
+import wait
 from utils import talosError,MakeDirectoryContentsWritable
 
 class FFProcess(object):
@@ -63,7 +64,7 @@ class FFProcess(object):
             #this is for windows machines.  when attempting to send kill messages to win processes the OS
             # always gives the process a chance to close cleanly before terminating it, this takes longer
             # and we need to give it a little extra time to complete
-            time.sleep(browser_wait)
+            wait.until(lambda: not self.checkAllProcesses(process_name, child_process), browser_wait)
             processes = self.checkAllProcesses(process_name, child_process)
             if processes:
                 raise talosError("failed to cleanup processes: %s" % processes)
@@ -164,3 +165,23 @@ user_pref("capability.principal.codebase.p2.subjectName", "");
             fileData = results_file.read()
             results_file.close()
         return fileData
+
+    def tailFile(self, handle, offset=0):
+        """returns (data, offset): the data appended to a file since offset
+        and the offset to pass for the next read.
+        If the file is shorter than offset, it has been replaced and
+        is read from the beginning.
+        """
+        if not os.path.isfile(handle):
+            return '', 0
+        results_file = open(handle, "r")
+        try:
+            results_file.seek(0, 2)
+            if results_file.tell() < offset:
+                offset = 0
+            results_file.seek(offset)
+            fileData = results_file.read()
+            offset = results_file.tell()
+        finally:
+            results_file.close()
+        return fileData, offset
@@ -10,6 +10,7 @@ import time
 from ffprocess import FFProcess
 import shutil
 import utils
+import wait
 
 
 class LinuxProcess(FFProcess):
@@ -34,20 +35,21 @@ class LinuxProcess(FFProcess):
         return cmd
 
 
-    def _GetPidsByName(self, process_name):
+    def _GetPidsByName(self, process_name, ttl=0):
         """Searches for processes containing a given string.
 
         Args:
             process_name: The string to be searched for
+            ttl: reuse a process table read less than ttl seconds ago
 
         Returns:
             A list of PIDs containing the string. An empty list is returned if none are
             found.
         """
-        processes = utils.running_processes(process_name)
+        processes = utils.running_processes(process_name, ttl=ttl)
         return [pid for pid,_ in processes]
 
-    def TerminateProcess(self, pid, timeout):
+    def _TerminateProcess(self, pid, timeout):
         """Helper function to terminate a process, given the pid
 
         Args:
@@ -58,7 +60,8 @@ class LinuxProcess(FFProcess):
             for sig in ('SIGABRT', 'SIGTERM', 'SIGKILL'):
                 if utils.is_running(pid):
                     os.kill(pid, getattr(signal, sig))
-                    time.sleep(timeout)
+                    # give the process up to timeout seconds to exit
+                    wait.until(lambda: not utils.is_running(pid), timeout)
                     ret = 'killed with %s' % sig
         except OSError, (errno, strerror):
             print 'WARNING: failed os.kill: %s : %s' % (errno, strerror)
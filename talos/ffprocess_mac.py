@@ -14,6 +14,7 @@ from select import select
 from ffprocess import FFProcess
 import shutil
 import utils
+import wait
 import platform
 
 
@@ -70,7 +71,8 @@ class MacProcess(FFProcess):
             for sig in ('SIGTERM', 'SIGKILL'):
                 if utils.is_running(pid, psarg='-Acj'):
                     os.kill(pid, getattr(signal, sig))
-                    time.sleep(timeout)
+                    # give the process up to timeout seconds to exit
+                    wait.until(lambda: not utils.is_running(pid, psarg='-Acj'), timeout)
                     ret = 'killed with %s' % sig
         except OSError, (errno, strerror):
             print 'WARNING: failed os.kill: %s : %s' % (errno, strerror)
@@ -30,6 +30,7 @@
 #
 # ***** END LICENSE BLOCK *****
 from ffprocess import FFProcess
+import inspect
 import os
 import time
 import tempfile
@@ -165,6 +166,29 @@ class RemoteProcess(FFProcess):
 
         return data
 
+    def tailFile(self, remote_filename, offset=0):
+        """returns (data, offset): the data appended to a remote file since
+        offset and the offset to pass for the next read.
+        Only the new data is pulled if the device manager supports it;
+        otherwise the whole file is pulled and sliced.
+        """
+        try:
+            if not self.testAgent.fileExists(remote_filename):
+                return '', 0
+            if 'offset' in inspect.getargspec(self.testAgent.pullFile)[0]:
+                data = self.testAgent.pullFile(remote_filename, offset=offset) or ''
+                return data, offset + len(data)
+            data = self.testAgent.pullFile(remote_filename)
+        except mozdevice.DMError:
+            print "Remote Device Error: Error pulling file %s from " \
+                "device" % remote_filename
+            raise
+
+        if len(data) < offset:
+            # the file has been replaced
+            offset = 0
+        return data[offset:], len(data)
+
     def recordLogcat(self):
         self.testAgent.recordLogcat()
 
@@ -43,10 +43,12 @@
 __author__ = 'annie.sullivan@gmail.com (Annie Sullivan)'
 
 
+import atexit
 import os
 import os.path
 import re
 import shutil
+import sys
 import tempfile
 import time
 import glob
@@ -56,7 +58,35 @@ from xml.dom import minidom
 from utils import talosError, zip_extractall,MakeDirectoryContentsWritable
 import utils
 import subprocess
-
+import wait
+
+def sha1():
+    """Returns a new sha1 digest"""
+    try:
+        # hashlib is new in python 2.5
+        import hashlib
+        return hashlib.sha1()
+    except ImportError:
+        import sha
+        return sha.new()
+
+def digest_file(digest, path):
+    """Updates digest with the contents of the file at path"""
+    f = open(path, 'rb')
+    for chunk in iter(lambda: f.read(1 << 16), ''):
+        digest.update(chunk)
+    f.close()
+
+_run_directory = None
+
+def run_directory():
+    """Returns a private temporary directory for this run of talos,
+       which is removed when talos exits."""
+    global _run_directory
+    if _run_directory is None:
+        _run_directory = tempfile.mkdtemp(prefix='talos-')
+        atexit.register(shutil.rmtree, _run_directory, True)
+    return _run_directory
 
 class FFSetup(object):
 
@@ -66,12 +96,31 @@ class FFSetup(object):
     _port = ''
     _hostproc = None
 
+    # prepared profiles are cached, keyed by a digest of the source
+    # profile, prefs and extensions, so each is only built once; set to
+    # False to build every profile from scratch
+    cache_profiles = True
+
+    # directory of the profile cache; by default it is in the temporary
+    # directory of this run, removed when talos exits.  Set it to keep
+    # prepared profiles between runs
+    profile_cache = None
+
+    # files left in an initialized profile by the initialization run
+    # which are not kept
+    warm_profile_excluded = ['lock', '.parentlock', 'minidumps']
+
+    # maximum number of extensions installed at once
+    install_threads = 4
+
     def __init__(self, procmgr, options = None):
         self.ffprocess = procmgr
         self._hostproc = procmgr
         if options is not None:
             self.intializeRemoteDevice(options)
         self.extensions = None
+        self.profile_entry = None # cache entry of the current profile
+        self._browser_keys = {}
 
     def initializeRemoteDevice(self, options, hostproc=None):
         self._remoteWebServer = options['webserver']
@@ -103,13 +152,13 @@ class FFSetup(object):
             out_value = '"%s"' % value
         return 'user_pref("%s", %s);%s' % (name, out_value, newline)
 
-    def install_addon(self, profile_path, addon):
-        """Installs the given addon in the profile.
-           most of this borrowed from mozrunner, except downgraded to work on python 2.4
-           # Contributor(s) for mozrunner:
-           # Mikeal Rogers <mikeal.rogers@gmail.com>
-           # Clint Talbert <ctalbert@mozilla.com>
-           # Henrik Skupin <hskupin@mozilla.com>
+    # xpi sha1 -> (addon id, unpack), shared by all profiles
+    _addon_metadata = {}
+
+    def addon_metadata(self, addon):
+        """Returns the id and unpack flag from the install.rdf of the given
+           addon directory or .xpi file.  The results for .xpi files are
+           cached by their hash, so each is only parsed once.
         """
         def getText(nodelist):
             rc = []
@@ -152,16 +201,19 @@ class FFSetup(object):
                     unpack = 'false'
             return unpack
 
-        tmpdir = None
-        addon_id = None
+        key = None
         if os.path.isdir(addon):
-            addonSrcPath = addon
+            doc = minidom.parse(os.path.join(addon, 'install.rdf'))
         else:
-            tmpdir = tempfile.mkdtemp(suffix = "." + os.path.split(addon)[-1])
-            zip_extractall(zipfile.ZipFile(addon), tmpdir)
-            addonSrcPath = tmpdir
-
-        doc = minidom.parse(os.path.join(addonSrcPath, 'install.rdf'))
+            digest = sha1()
+            digest_file(digest, addon)
+            key = digest.hexdigest()
+            if key in self._addon_metadata:
+                return self._addon_metadata[key]
+            # read the manifest straight from the xpi
+            xpi = zipfile.ZipFile(addon)
+            doc = minidom.parseString(xpi.read('install.rdf'))
+            xpi.close()
         # description_element =
         # tree.find('.//{http://www.w3.org/1999/02/22-rdf-syntax-ns#}Description/')
 
@@ -176,46 +228,49 @@ class FFSetup(object):
         if not addon_id: #bail out, we don't have an addon id
             raise talosError("no addon_id found for extension")
 
-        if tmpdir is None or unpack.lower() == 'true':  #install addon unpacked
+        unpack = unpack.lower() == 'true'
+        if key:
+            self._addon_metadata[key] = (addon_id, unpack)
+        return addon_id, unpack
+
+    def install_addon(self, profile_path, addon):
+        """Installs the given addon in the profile.
+           most of this borrowed from mozrunner, except downgraded to work on python 2.4
+           # Contributor(s) for mozrunner:
+           # Mikeal Rogers <mikeal.rogers@gmail.com>
+           # Clint Talbert <ctalbert@mozilla.com>
+           # Henrik Skupin <hskupin@mozilla.com>
+        """
+        addon_id, unpack = self.addon_metadata(addon)
+
+        if os.path.isdir(addon) or unpack:  #install addon unpacked
             addon_path = os.path.join(profile_path, 'extensions', 'staged', addon_id)
             #if an old copy is already installed, remove it
             if os.path.isdir(addon_path):
                 shutil.rmtree(addon_path, ignore_errors=True)
-            shutil.copytree(addonSrcPath, addon_path)
+            if os.path.isdir(addon):
+                shutil.copytree(addon, addon_path)
+            else:
+                # extract straight into the profile
+                xpi = zipfile.ZipFile(addon)
+                zip_extractall(xpi, addon_path)
+                xpi.close()
         else: #do not unpack addon
             addon_file = os.path.join(profile_path, 'extensions', 'staged', addon_id + '.xpi')
             if os.path.isfile(addon_file):
                 os.remove(addon_file)
             shutil.copy(addon, addon_file)
 
-        if tmpdir:
-            # cleanup
-            shutil.rmtree(tmpdir, ignore_errors=True)
-
         return addon_id
 
-    def CreateTempProfileDir(self, source_profile, prefs, extensions, webserver):
-        """Creates a temporary profile directory from the source profile directory
-            and adds the given prefs and links to extensions.
-
-        Args:
-            source_profile: String containing the absolute path of the source profile
-                            directory to copy from.
-            prefs: Preferences to set in the prefs.js file of the new profile.  Format:
-                    {"PrefName1" : "PrefValue1", "PrefName2" : "PrefValue2"}
-            extensions: list of paths to .xpi files to be installed
+    def PrepareProfile(self, profile_dir, prefs, extensions, webserver):
+        """Writes the prefs to user.js and installs the extensions in
+            profile_dir.
 
         Returns:
-            String containing the absolute path of the profile directory.
+            List of the ids of the installed extensions.
         """
 
-        # Create a temporary directory for the profile, and copy the
-        # source profile to it.
-        temp_dir = tempfile.mkdtemp()
-        profile_dir = os.path.join(temp_dir, 'profile')
-        shutil.copytree(source_profile, profile_dir)
-        MakeDirectoryContentsWritable(profile_dir)
-
         # Copy the user-set prefs to user.js
         user_js_filename = os.path.join(profile_dir, 'user.js')
         user_js_file = open(user_js_filename, 'w')
@@ -231,9 +286,219 @@ class FFSetup(object):
         extension_dir = os.path.join(profile_dir, 'extensions', 'staged')
         if not os.path.exists(extension_dir):
             os.makedirs(extension_dir)
-        self.extensions = []
-        for addon in extensions:
-            self.extensions.append(self.install_addon(profile_dir, addon))
+        ThreadPool = None
+        if len(extensions) > 1 and self.install_threads > 1:
+            try:
+                # multiprocessing is new in python 2.6
+                from multiprocessing.pool import ThreadPool
+            except ImportError:
+                pass
+        if ThreadPool is None:
+            return [self.install_addon(profile_dir, addon) for addon in extensions]
+        # the addons are independent, so install them concurrently
+        pool = ThreadPool(min(len(extensions), self.install_threads))
+        try:
+            return pool.map(lambda addon: self.install_addon(profile_dir, addon), extensions)
+        finally:
+            pool.close()
+            pool.join()
+
+    def ProfileCache(self):
+        """Returns the directory of the profile cache, or None if profiles
+            are not cached."""
+        if not self.cache_profiles:
+            return None
+        return self.profile_cache or os.path.join(run_directory(), 'profiles')
+
+    def ProfileKey(self, source_profile, prefs, extensions, webserver):
+        """Returns a digest identifying the profile that PrepareProfile would
+            produce from these arguments.  Files are identified by their
+            contents and their names within source_profile or an extension
+            directory.
+        """
+        digest = sha1()
+        digest.update(repr((sorted(prefs.items()), webserver)))
+        for path in [source_profile] + list(extensions):
+            digest.update('\0\0')
+            if os.path.isdir(path):
+                for root, dirs, files in os.walk(path):
+                    dirs.sort()
+                    files.sort()
+                    digest.update('\0%s/' % root[len(path):])
+                    for name in files:
+                        digest.update('\0%s\0' % name)
+                        digest_file(digest, os.path.join(root, name))
+            else:
+                digest_file(digest, path)
+        return digest.hexdigest()
+
+    def CachedProfile(self, source_profile, prefs, extensions, webserver):
+        """Returns the path of a prepared copy of source_profile in the
+            profile cache, and the ids of its extensions, building it if
+            needed.  The cached profile must not be modified; use
+            CloneProfile to copy it.
+        """
+        profile_cache = self.ProfileCache()
+        key = self.ProfileKey(source_profile, prefs, extensions, webserver)
+        entry = os.path.join(profile_cache, key)
+        if not os.path.isdir(entry):
+            if not os.path.isdir(profile_cache):
+                try:
+                    os.makedirs(profile_cache)
+                except OSError:
+                    # created concurrently
+                    if not os.path.isdir(profile_cache):
+                        raise
+            # build in a temporary directory and move it into place, so that
+            # concurrent runs never see a partial profile
+            build_dir = tempfile.mkdtemp(dir=profile_cache)
+            try:
+                profile_dir = os.path.join(build_dir, 'profile')
+                shutil.copytree(source_profile, profile_dir)
+                MakeDirectoryContentsWritable(profile_dir)
+                addon_ids = self.PrepareProfile(profile_dir, prefs, extensions, webserver)
+                f = open(os.path.join(build_dir, 'extensions.txt'), 'w')
+                f.write(''.join(['%s\n' % addon_id for addon_id in addon_ids]))
+                f.close()
+                try:
+                    os.rename(build_dir, entry)
+                except OSError:
+                    # another run built it first
+                    if not os.path.isdir(entry):
+                        raise
+            finally:
+                if os.path.isdir(build_dir):
+                    shutil.rmtree(build_dir, ignore_errors=True)
+            utils.debug("cached profile %s", entry)
+
+        f = open(os.path.join(entry, 'extensions.txt'))
+        addon_ids = f.read().splitlines()
+        f.close()
+        self.profile_entry = entry
+        return os.path.join(entry, 'profile'), addon_ids
+
+    def BrowserKey(self, browser_config):
+        """Returns a digest identifying the browser build and the way it is
+            launched to initialize a profile."""
+        browser_path = browser_config['browser_path']
+        st = os.stat(browser_path)
+        cache_key = (browser_path, st.st_size, st.st_mtime)
+        if cache_key not in self._browser_keys:
+            digest = sha1()
+            digest.update(repr((browser_config['extra_args'], browser_config['init_url'])))
+            # application.ini carries the BuildID of the build
+            for path in (browser_path,
+                         os.path.join(os.path.dirname(browser_path), 'application.ini')):
+                if os.path.isfile(path):
+                    digest_file(digest, path)
+                    digest.update('\0')
+            self._browser_keys[cache_key] = digest.hexdigest()
+        return self._browser_keys[cache_key]
+
+    def WarmedProfile(self, browser_config):
+        """Returns the directory holding the initialized copy of the current
+            profile for this browser, or None if profiles are not cached.
+            Initialized profiles are only kept for this run."""
+        if not self.profile_entry or self._host:
+            return None
+        return os.path.join(run_directory(), 'warm', '%s-%s' % (os.path.basename(self.profile_entry),
+                                                                 self.BrowserKey(browser_config)))
+
+    def SaveWarmedProfile(self, warm_dir, profile_dir, browser_info):
+        """Stores the initialized profile_dir and the browser_info fields
+            parsed from its initialization in warm_dir.  The files listed in
+            warm_profile_excluded are left out.  The copy is only valid
+            at profile_dir, as the browser records absolute paths into the
+            profile."""
+        parent = os.path.dirname(warm_dir)
+        if not os.path.isdir(parent):
+            try:
+                os.makedirs(parent)
+            except OSError:
+                if not os.path.isdir(parent):
+                    raise
+        build_dir = tempfile.mkdtemp(dir=parent)
+        try:
+            warm_profile = os.path.join(build_dir, 'profile')
+            shutil.copytree(profile_dir, warm_profile, symlinks=True)
+            for name in self.warm_profile_excluded:
+                path = os.path.join(warm_profile, name)
+                if os.path.isdir(path) and not os.path.islink(path):
+                    shutil.rmtree(path)
+                elif os.path.lexists(path):
+                    os.remove(path)
+            f = open(os.path.join(build_dir, 'browser_info.txt'), 'w')
+            for key, value in sorted(browser_info.items()):
+                f.write('%s:%s\n' % (key, value))
+            f.close()
+            # the paths recorded in the profile point into this
+            f = open(os.path.join(build_dir, 'profile_dir.txt'), 'w')
+            f.write(profile_dir)
+            f.close()
+            try:
+                os.rename(build_dir, warm_dir)
+            except OSError:
+                if not os.path.isdir(warm_dir):
+                    raise
+        finally:
+            if os.path.isdir(build_dir):
+                shutil.rmtree(build_dir, ignore_errors=True)
+        utils.debug("cached initialized profile %s", warm_dir)
+
+    def CloneProfile(self, source, dest):
+        """Copies the profile directory source to dest, which must not exist.
+            On Linux this shares the file data with the source where the
+            filesystem supports it (cp --reflink), as profiles are copied
+            for every test.
+        """
+        if sys.platform.startswith('linux'):
+            try:
+                if subprocess.call(['cp', '-a', '--reflink=auto', source, dest]) == 0:
+                    return
+            except OSError:
+                pass
+            # fall back to a plain copy
+            if os.path.exists(dest):
+                shutil.rmtree(dest, ignore_errors=True)
+        shutil.copytree(source, dest)
+
+    def CreateTempProfileDir(self, source_profile, prefs, extensions, webserver):
+        """Creates a temporary profile directory from the source profile directory
+            and adds the given prefs and links to extensions.
+
+        Args:
+            source_profile: String containing the absolute path of the source profile
+                            directory to copy from.
+            prefs: Preferences to set in the prefs.js file of the new profile.  Format:
+                    {"PrefName1" : "PrefValue1", "PrefName2" : "PrefValue2"}
+            extensions: list of paths to .xpi files to be installed
+
+        Returns:
+            String containing the absolute path of the profile directory.
+        """
+
+        # Create a temporary directory for the profile, and copy the
+        # prepared profile to it.
+        self.profile_entry = None
+        if self.cache_profiles:
+            cached_profile, self.extensions = self.CachedProfile(source_profile, prefs,
+                                                                 extensions, webserver)
+            # every copy of a cached profile is made at the same path, so
+            # that the absolute paths the browser records in an initialized
+            # profile hold for the copies it is reused for
+            temp_dir = os.path.join(run_directory(), 'tests', os.path.basename(self.profile_entry))
+            if os.path.exists(temp_dir):
+                # left over from a test which was not cleaned up
+                shutil.rmtree(temp_dir, ignore_errors=True)
+            os.makedirs(temp_dir)
+            profile_dir = os.path.join(temp_dir, 'profile')
+            self.CloneProfile(cached_profile, profile_dir)
+        else:
+            temp_dir = tempfile.mkdtemp()
+            profile_dir = os.path.join(temp_dir, 'profile')
+            shutil.copytree(source_profile, profile_dir)
+            MakeDirectoryContentsWritable(profile_dir)
+            self.extensions = self.PrepareProfile(profile_dir, prefs, extensions, webserver)
 
         if webserver != 'localhost' and self._host != '':
             remote_dir = self.ffprocess.copyDirToDevice(profile_dir)
@@ -259,6 +524,10 @@ class FFSetup(object):
             Returns 1 (success) if PROFILE_REGEX is found,
             and 0 (failure) otherwise
 
+            If the profile was already initialized with this browser in the
+            profile cache, at the same path, the initialized copy is used
+            instead of launching the browser.
+
         Args:
             browser_config: object containing all the browser_config options
             profile_dir: The full path to the profile directory to load
@@ -266,6 +535,23 @@ class FFSetup(object):
         INFO_REGEX = re.compile('__browserInfo(.*)__browserInfo', re.DOTALL|re.MULTILINE)
         PROFILE_REGEX = re.compile('__metrics(.*)__metrics', re.DOTALL|re.MULTILINE)
 
+        warm_dir = self.WarmedProfile(browser_config)
+        warm_profile_dir = None
+        if warm_dir and os.path.isdir(warm_dir):
+            f = open(os.path.join(warm_dir, 'profile_dir.txt'))
+            warm_profile_dir = f.read()
+            f.close()
+        if warm_profile_dir == profile_dir:
+            shutil.rmtree(profile_dir)
+            self.CloneProfile(os.path.join(warm_dir, 'profile'), profile_dir)
+            f = open(os.path.join(warm_dir, 'browser_info.txt'))
+            for line in f.read().splitlines():
+                key, value = line.split(':', 1)
+                browser_config[key] = value
+            f.close()
+            utils.debug("using initialized profile %s", warm_dir)
+            return 1
+
         command_line = self.ffprocess.GenerateBrowserCommandLine(browser_config["browser_path"], 
                                                                  browser_config["extra_args"], 
                                                                  browser_config["deviceroot"],
@@ -283,12 +569,17 @@ class FFSetup(object):
 
         timeout = True
         total_time = 0
-        while total_time < 1200: #20 minutes
-            time.sleep(1)
-            if process.poll() != None: #browser_controller completed, file now full
-                timeout = False
-                break
-            total_time += 1
+        waiter = wait.Waiter()
+        try:
+            waiter.watch_process(process.pid)
+            while total_time < 1200: #20 minutes
+                waiter.wait(1)
+                if process.poll() != None: #browser_controller completed, file now full
+                    timeout = False
+                    break
+                total_time += 1
+        finally:
+            waiter.close()
         if timeout:
             raise talosError("initialization timed out")
 
@@ -306,17 +597,22 @@ class FFSetup(object):
             utils.info("Could not find %s in browser_log: %s", PROFILE_REGEX.pattern, log)
             utils.info("Raw results:%s", results_raw)
             utils.info("Initialization of new profile failed")
+        browser_info = {}
         match = INFO_REGEX.search(results_raw)
         if match:
             binfo = match.group(1)
             print binfo
             for line in binfo.split('\n'):
                 if line.strip().startswith('browser_name'):
-                    browser_config['browser_name'] = line.split(':')[1]
+                    browser_info['browser_name'] = line.split(':')[1]
                 if line.strip().startswith('browser_version'):
-                    browser_config['browser_version'] = line.split(':')[1]
+                    browser_info['browser_version'] = line.split(':')[1]
                 if line.strip().startswith('buildID'):
-                    browser_config['buildid'] = line.split(':')[1]
+                    browser_info['buildid'] = line.split(':')[1]
+            browser_config.update(browser_info)
+
+        if res and warm_dir:
+            self.SaveWarmedProfile(warm_dir, profile_dir, browser_info)
 
         return res
 
@@ -1,10 +1,17 @@
 import math
+import random
 
 """
 data filters:
 takes a series of run data and applies statistical transforms to it
 """
 
+try:
+    import numpy
+except ImportError:
+    # numpy is optional; without it apply_batch filters one series at a time
+    numpy = None
+
 ### filters that return a scalar
 
 def mean(series):
@@ -67,7 +74,108 @@ def geometric_mean(series):
         total += math.log(i)
     return math.exp(total / len(series))
 
-scalar_filters = [mean, median, max, min, variance, stddev, dromaeo]
+def percentile(series, percent=95):
+    """
+    percentile of data, interpolating linearly between the closest ranks:
+    http://en.wikipedia.org/wiki/Percentile ;
+    needs at least one data point
+    """
+    assert 0 <= percent <= 100, "percentile must be between 0 and 100: %s" % percent
+    series = sorted(series)
+    lower, upper, fraction = percentile_ranks(len(series), percent)
+    return series[lower] + (series[upper] - series[lower])*fraction
+
+def percentile_ranks(length, percent):
+    """
+    return the (lower, upper) indices of a sorted series of length `length`
+    that bracket `percent` and the fraction of the way between them
+    """
+    rank = (length - 1) * percent / 100.
+    lower = int(math.floor(rank))
+    upper = min(lower + 1, length - 1)
+    return lower, upper, rank - lower
+
+def trimmed_mean(series, percent=10):
+    """
+    mean of data excluding the lowest and highest `percent`% of data points:
+    http://en.wikipedia.org/wiki/Truncated_mean ;
+    needs at least one data point
+    """
+    assert 0 <= percent < 50, "trimmed_mean must trim less than 50%%: %s" % percent
+    trim = int(len(series) * percent / 100.)
+    series = sorted(series)
+    return mean(series[trim:len(series)-trim])
+
+class Estimate(float):
+    """
+    a filtered value along with its confidence interval, [low, high]
+    """
+
+    def __new__(cls, value, low, high):
+        self = float.__new__(cls, value)
+        self.low = low
+        self.high = high
+        return self
+
+# resampling is seeded so that runs are reproducible
+bootstrap_seed = 1
+
+def bootstrap(series, function, confidence=95, resamples=1000, args=()):
+    """
+    bootstrap confidence interval of the statistic function(series, *args):
+    http://en.wikipedia.org/wiki/Bootstrapping_%28statistics%29
+    returns function(series, *args) as an Estimate.
+    The resamples are always drawn from python's random module, so the
+    interval is the same with or without numpy; with numpy they are
+    reduced as one array.
+    """
+    assert 0 < confidence < 100, "confidence must be between 0 and 100: %s" % confidence
+    value = function(series, *args)
+    length = len(series)
+    generator = random.Random(bootstrap_seed)
+    samples = [[int(generator.random()*length) for j in xrange(length)]
+               for i in xrange(resamples)]
+    if numpy is not None and function in batch_filters:
+        data = numpy.asarray(series, dtype=float)
+        estimates = batch_filters[function](data[numpy.array(samples)], *args).tolist()
+    else:
+        estimates = [function([series[j] for j in sample], *args) for sample in samples]
+    tail = (100 - confidence) / 2.
+    return Estimate(value,
+                    percentile(estimates, tail),
+                    percentile(estimates, 100 - tail))
+
+def estimate(series, filters, confidence=95, resamples=1000):
+    """
+    apply filters to a data series, returning the result as an Estimate
+    with a bootstrap confidence interval of the last (scalar) filter
+    """
+    filters = [_filter_args(f) for f in filters]
+    series = apply(series, filters[:-1])
+    reducer, args = filters[-1]
+    if reducer in bootstrap_filters:
+        return reducer(series, *args)
+    return bootstrap(series, reducer, confidence, resamples, args)
+
+def bootstrap_median(series, confidence=95, resamples=1000):
+    """
+    median of data with a bootstrap confidence interval;
+    needs at least one data point
+    """
+    return bootstrap(series, median, confidence, resamples)
+
+def bootstrap_mean(series, confidence=95, resamples=1000):
+    """
+    mean of data with a bootstrap confidence interval;
+    needs at least one data point
+    """
+    return bootstrap(series, mean, confidence, resamples)
+
+scalar_filters = [mean, median, max, min, variance, stddev, dromaeo, percentile, trimmed_mean,
+                  bootstrap_median, bootstrap_mean]
+
+# reducers returning an Estimate
+bootstrap_filters = [bootstrap_median, bootstrap_mean]
 
 ### filters that return a list
 
@@ -111,6 +219,78 @@ series_filters = [ignore_first, ignore_max, ignore_min]
 scalar_filters = dict([(i.__name__, i) for i in scalar_filters])
 series_filters = dict([(i.__name__, i) for i in series_filters])
 
+### batched filters
+### these take a 2-D numpy array of (series x data points) and
+### must give the same values as the per-series filters they mirror
+
+def _batch_mean(data):
+    # cumsum adds left to right, as sum() does; numpy.sum does not
+    return data.cumsum(axis=1)[:, -1] / float(data.shape[1])
+
+def _batch_median(data):
+    # partition selects the order statistics in linear time
+    middle = data.shape[1] / 2
+    if data.shape[1] % 2:
+        # odd
+        return numpy.partition(data, middle, axis=1)[:, middle]
+    # even
+    data = numpy.partition(data, [middle-1, middle], axis=1)
+    return 0.5*(data[:, middle-1] + data[:, middle])
+
+def _batch_percentile(data, percent=95):
+    assert 0 <= percent <= 100, "percentile must be between 0 and 100: %s" % percent
+    lower, upper, fraction = percentile_ranks(data.shape[1], percent)
+    data = numpy.partition(data, sorted(set([lower, upper])), axis=1)
+    return data[:, lower] + (data[:, upper] - data[:, lower])*fraction
+
+def _batch_trimmed_mean(data, percent=10):
+    assert 0 <= percent < 50, "trimmed_mean must trim less than 50%%: %s" % percent
+    trim = int(data.shape[1] * percent / 100.)
+    # sorted, so the sum is taken in the same order as trimmed_mean
+    data = numpy.sort(data, axis=1)
+    return _batch_mean(data[:, trim:data.shape[1]-trim])
+
+def _batch_max(data):
+    return data.max(axis=1)
+
+def _batch_min(data):
+    return data.min(axis=1)
+
+def _batch_ignore_first(data, number=1):
+    if data.shape[1] <= number:
+        # don't modify short series
+        return data
+    return data[:, number:]
+
+def _batch_ignore(data, index):
+    """drop the data point at index[i] from each series i"""
+    if data.shape[1] <= 1:
+        # don't modify short series
+        return data
+    mask = numpy.ones(data.shape, dtype=bool)
+    mask[numpy.arange(data.shape[0]), index] = False
+    return data[mask].reshape(data.shape[0], data.shape[1] - 1)
+
+def _batch_ignore_max(data):
+    # argmax gives the first occurence, as list.remove does
+    return _batch_ignore(data, data.argmax(axis=1))
+
+def _batch_ignore_min(data):
+    return _batch_ignore(data, data.argmin(axis=1))
+
+# filters without a batched version (e.g. stddev, dromaeo)
+# are applied one series at a time; variance is not batched as numpy
+# squares may round differently from python's ** operator
+batch_filters = {mean: _batch_mean,
+                 median: _batch_median,
+                 max: _batch_max,
+                 min: _batch_min,
+                 percentile: _batch_percentile,
+                 trimmed_mean: _batch_trimmed_mean,
+                 ignore_first: _batch_ignore_first,
+                 ignore_max: _batch_ignore_max,
+                 ignore_min: _batch_ignore_min}
+
 ### utility functions
 
 def parse(filter_name):
@@ -180,16 +360,128 @@ def filters_args(_filters):
         retval.append([filter_functions[index], value[-1]])
     return retval
 
+### compiled filter chains
+
+class SeriesSelection(object):
+    """
+    a run of series filters fused into a single step:
+    the data is copied once and each filter is applied to the copy
+    """
+
+    def __init__(self, steps):
+        self.steps = steps # [[function, args], ...]
+
+    def __call__(self, series):
+        series = list(series)
+        for f, args in self.steps:
+            if f is ignore_first:
+                number = (list(args) + [1])[0]
+                if len(series) > number:
+                    del series[:number]
+            elif f in (ignore_max, ignore_min):
+                if len(series) > 1:
+                    # list.remove drops the first occurence, as ignore() does
+                    if f is ignore_max:
+                        series.remove(max(series))
+                    else:
+                        series.remove(min(series))
+            else:
+                series = f(series, *args)
+        return series
+
+class Pipeline(tuple):
+    """
+    a validated chain of [function, args] filters, as returned by pipeline();
+    may be used anywhere a list of filters is accepted
+    """
+
+    def __call__(self, data):
+        return apply(data, self)
+
+_pipelines = {} # cache of Pipelines keyed by filter spec
+
+def pipeline(_filters):
+    """
+    return a Pipeline for a list of [['filter_name', args]]
+    as filters_args does. The filters are only validated the first time a
+    given spec is seen; afterwards the same Pipeline is returned.
+    Adjacent series filters are fused into a single step.
+    """
+    key = tuple([(f[0], tuple(f[-1])) for f in _filters])
+    if key in _pipelines:
+        return _pipelines[key]
+
+    steps = []
+    selection = []
+    for f, args in filters_args(_filters):
+        if f in series_filters.values():
+            selection.append([f, tuple(args)])
+            continue
+        if len(selection) > 1:
+            steps.append([SeriesSelection(selection), ()])
+        else:
+            steps.extend(selection)
+        selection = []
+        steps.append([f, tuple(args)])
+    retval = _pipelines[key] = Pipeline(steps)
+    return retval
+
+def _filter_args(f):
+    """
+    return a [function, args] pair from a filter given as
+    function, [function] or [function, args]
+    """
+    args = ()
+    if isinstance(f, list) or isinstance(f, tuple):
+        if len(f) == 2: # function, extra arguments
+            f, args = f
+        elif len(f) == 1: # function
+            f = f[0]
+        else:
+            raise AssertionError("Each value must be either [filter, [args]] or [filter]")
+    return [f, args]
+
+def normalize(filters):
+    """return filters as a hashable tuple of (function, args) pairs"""
+    return tuple([(f, tuple(args)) for f, args in [_filter_args(f) for f in filters]])
+
 def apply(data, filters):
     """apply filters to a data series. does no safety check"""
     for f in filters:
-        args = ()
-        if isinstance(f, list) or isinstance(f, tuple):
-            if len(f) == 2: # function, extra arguments
-                f, args = f
-            elif len(f) == 1: # function
-                f = f[0]
-            else:
-                raise AssertionError("Each value must be either [filter, [args]] or [filter]")
+        f, args = _filter_args(f)
         data = f(data, *args)
     return data
+
+def apply_batch(series, filters):
+    """
+    apply filters to each of a list of data series;
+    returns the same as [apply(data, filters) for data in series].
+    If numpy is available and the series are of equal length
+    the filters are run over all of the series in one pass.
+    does no safety check
+    """
+    series = list(series)
+    if numpy is None or not series:
+        return [apply(data, filters) for data in series]
+    length = len(series[0])
+    if not length or [data for data in series if len(data) != length]:
+        # not a rectangular data set
+        return [apply(data, filters) for data in series]
+
+    _filters = []
+    for f, args in [_filter_args(f) for f in filters]:
+        if isinstance(f, SeriesSelection):
+            # unfuse to use the batched series filters
+            _filters.extend(f.steps)
+        else:
+            _filters.append([f, args])
+    filters = _filters
+
+    data = numpy.array(series, dtype=float)
+    for index, (f, args) in enumerate(filters):
+        batch_filter = batch_filters.get(f)
+        if batch_filter is None:
+            # finish up one series at a time
+            return [apply(i, filters[index:]) for i in data.tolist()]
+        data = batch_filter(data, *args)
+    return data.tolist()
@@ -13,6 +13,7 @@ import tempfile
 import time
 import urllib
 import utils
+from cmanager import CounterSeries
 from StringIO import StringIO
 from dzclient import DatazillaRequest, DatazillaResult, DatazillaResultsCollection
 
@@ -78,6 +79,15 @@ class Output(object):
     def post(self, results, server, path, scheme, tbpl_output):
         raise NotImplementedError("Abstract base class")
 
+    def test_filters(self, test):
+        """return the filters for a test: its own, if given, else the global filters"""
+        if 'filters' in test.test_config:
+            try:
+                return filter.pipeline(test.test_config['filters'])
+            except AssertionError, e:
+                raise utils.talosError(str(e))
+        return self.results.filters
+
     @classmethod
     def shortName(cls, name):
         """short name for counters"""
@@ -87,7 +97,13 @@ class Output(object):
                  "RSS": "rss",
                  "XRes": "xres",
                  "Modified Page List Bytes": "modlistbytes",
-                 "Main_RSS": "main_rss"}
+                 "Main_RSS": "main_rss",
+                 "Voluntary Context Switches": "vcsw",
+                 "Involuntary Context Switches": "ivcsw",
+                 "Minor Faults": "minflt",
+                 "Major Faults": "majflt",
+                 "Read Bytes": "read_bytes",
+                 "Write Bytes": "write_bytes"}
         return names.get(name, name)
 
     @classmethod
@@ -192,16 +208,11 @@ class GraphserverOutput(Output):
             # HACK: when running xperf, we upload xperf counters to the graph server but we do not want to
             # upload the test results as they will confuse the graph server
             if not test.using_xperf:
+                # per test filters
+                _filters = self.test_filters(test)
+
                 vals = []
                 for result in test.results:
-                    # per test filters
-                    _filters = self.results.filters
-                    if 'filters' in test.test_config:
-                        try:
-                            _filters = filter.filters_args(test.test_config['filters'])
-                        except AssertionError, e:
-                            raise utils.talosError(str(e))
-
                     vals.extend(result.values(_filters))
                 result_strings.append(self.construct_results(vals, testname=testname, **info_dict))
                 utils.stamped_msg("Generating results file: %s" % test.name(), "Stopped")
@@ -223,7 +234,10 @@ class GraphserverOutput(Output):
                         continue
 
                     # counter values
-                    vals = [[x, 'NULL'] for x in values]
+                    if isinstance(values, CounterSeries):
+                        vals = values
+                    else:
+                        vals = [[x, 'NULL'] for x in values]
 
                     # append test name extension but only for tpformat tests
                     if test.format == 'tpformat':
@@ -249,11 +263,17 @@ class GraphserverOutput(Output):
     def construct_results(self, vals, testname, **info):
         """
         return results string appropriate to graphserver
-        - vals: list of 2-tuples: [(val, page)
+        - vals: list of 2-tuples: [(val, page)], or a CounterSeries
         - kwargs: info necessary for self.info_format interpolation
         see https://wiki.mozilla.org/Buildbot/Talos/DataFormat
         """
 
+        series = None
+        if isinstance(vals, CounterSeries):
+            # counter values are written straight from the series
+            series = vals
+            vals = ((val, 'NULL') for val in series)
+
         info['testname'] = testname
         info_format = self.info_format
         responsiveness = self.responsiveness_test(testname)
@@ -286,9 +306,14 @@ class GraphserverOutput(Output):
         if average is not None:
             # write some kind of average
             buffer.write("%s\n" % average)
+        elif series is not None:
+            series.write_graphserver(buffer)
         else:
             for i, (val, page) in enumerate(vals):
                 buffer.write("%d,%.2f,%s\n" % (i,float(val), page))
+                if isinstance(val, filter.Estimate):
+                    # graphserver has no place for the interval; log it
+                    utils.info("%s: %s: %.2f [%.2f, %.2f]", testname, page, val, val.low, val.high)
         buffer.write("END")
         return buffer.getvalue()
 
@@ -458,9 +483,23 @@ class DatazillaOutput(Output):
                 for result, values in results.items():
                     res.add_test_results(suite, result, values)
 
+                # confidence intervals from filters such as bootstrap_median;
+                # the values are shared with the other outputs
+                intervals = []
+                _filters = self.test_filters(test)
+                if _filters and filter.normalize(_filters)[-1][0] in filter.bootstrap_filters:
+                    for result in test.results:
+                        intervals.extend([[page, float(val), val.low, val.high]
+                                          for val, page in result.values(_filters)
+                                          if isinstance(val, filter.Estimate)])
+                if intervals:
+                    res.add_talos_auxiliary(suite, 'confidence_intervals', intervals)
+
                 # counters results_aux data
                 for cd in test.all_counter_results:
                     for name, vals in cd.items():
+                        if isinstance(vals, CounterSeries):
+                            vals = vals.datazilla()
                         res.add_talos_auxiliary(suite, name, vals)
             else:
                 # specific xperf_aux data
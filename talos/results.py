@@ -18,13 +18,20 @@ import sys
 import time
 import utils
 import csv
+from array import array
 
 try:
     import json
 except ImportError:
     import simplejson as json
 
-__all__ = ['TalosResults', 'TestResults', 'TsResults', 'PageloaderResults', 'BrowserLogResults', 'main']
+try:
+    import numpy
+except ImportError:
+    # numpy is optional; without it runs are converted one float at a time
+    numpy = None
+
+__all__ = ['TalosResults', 'TestResults', 'TsResults', 'PageloaderResults', 'BrowserLogResults', 'BrowserLogScanner', 'main']
 
 class TalosResults(object):
     """Container class for Talos results"""
@@ -108,10 +115,72 @@ class TestResults(object):
         self.all_counter_results = []
         self.extensions = extensions
         self.using_xperf = False
+        self.scanner = None # BrowserLogScanner of the cycle in progress
 
     def name(self):
         return self.test_config['name']
 
+    def estimates(self, filters):
+        """
+        estimate the filtered value for each page from all cycles so far;
+        returns a list of [filter.Estimate, page]
+        """
+        pages = []
+        series = {}
+        for results in self.results:
+            for page, runs in results.raw_values():
+                if page not in series:
+                    pages.append(page)
+                    series[page] = []
+                series[page].extend(runs)
+        return [[filter.estimate(series[page], filters), page] for page in pages]
+
+    def converged(self, filters, threshold):
+        """
+        whether the filtered value of every page is known to within
+        threshold: the width of its confidence interval relative to the value
+        """
+        estimates = self.estimates(filters)
+        if not estimates:
+            return False
+        for value, page in estimates:
+            if value.high - value.low > threshold * abs(value):
+                return False
+        return True
+
+    def start_cycle(self, counter_results=None):
+        """
+        start parsing the browser log of a new cycle while it is written;
+        the log output is passed to scan() as it arrives, and the log is then
+        passed to add() as usual
+        - counter_results : counters to be accumulated for this cycle
+        """
+        self.scanner = BrowserLogResults.make_scanner(counter_results, self.global_counters)
+
+    def scan(self, data):
+        """parse output appended to the browser log of the cycle in progress"""
+        self.scanner.feed(data)
+
+    def failure(self):
+        """the failure message reported so far by the cycle in progress, if any"""
+        if self.scanner is not None:
+            return self.scanner.parts.get(BrowserLogResults.fail_token)
+
+    def partial_values(self):
+        """
+        (page, runs) for the results of the cycle in progress which have
+        been written to the browser log so far
+        """
+        if self.scanner is None:
+            return []
+        for format, tokens in BrowserLogResults.report_tokens:
+            report = self.scanner.text(tokens[0])
+            if report is not None:
+                if not report.strip():
+                    break
+                return BrowserLogResults.classes[format](report).raw_values()
+        return []
+
     def add(self, results, counter_results=None):
         """
         accumulate one cycle of results
@@ -119,16 +188,21 @@ class TestResults(object):
         - counter_results : counters accumulated for this cycle
         """
 
+        scanner = self.scanner
+        self.scanner = None
         if isinstance(results, basestring):
             # ensure the browser log exists
             if not os.path.isfile(results):
                 raise talosError("no output from browser [%s]" % results)
 
-            # convert to a results class via parsing the browser log
-            browserLog = BrowserLogResults(filename=results, counter_results=counter_results, global_counters=self.global_counters)
+            # convert to a results class via parsing the browser log,
+            # unless it has been parsed already as it was written
+            if scanner is not None:
+                scanner.finish()
+            browserLog = BrowserLogResults(filename=results, counter_results=counter_results, global_counters=self.global_counters, scanner=scanner)
             results = browserLog.results()
+            self.using_xperf = browserLog.using_xperf
 
-        self.using_xperf = browserLog.using_xperf
         # ensure the results format matches previous results
         if self.results:
             if not results.format == self.results[0].format:
@@ -141,7 +215,85 @@ class TestResults(object):
         if counter_results:
             self.all_counter_results.append(counter_results)
 
+def parse_floats(fields):
+    """
+    convert a list of numeric strings to an array('d'), raising
+    ValueError as float() would; with numpy the strings are converted
+    without making a float object for each
+    """
+    if numpy is not None and fields:
+        return array('d', numpy.array(fields, dtype=float).tostring())
+    return array('d', map(float, fields))
+
+
+class ResultsTable(object):
+    """
+    columnar store of (index, page, runs) results: the runs of all pages
+    are kept in one flat array, with offsets[i]:offsets[i+1] the runs of
+    the i-th page
+    """
+
+    __slots__ = ('indices', 'pages', 'offsets', 'runs')
+
+    def __init__(self):
+        self.indices = array('l')
+        self.pages = [] # interned page names
+        self.offsets = array('l', [0])
+        self.runs = array('d')
+
+    def __len__(self):
+        return len(self.pages)
+
+    def append(self, index, page, runs):
+        self.extend([index], [page], [len(runs)], runs)
+
+    def extend(self, indices, pages, counts, runs):
+        """
+        append the results of several pages at once
+        - counts : the number of runs of each page
+        - runs : the runs of all the pages, in order
+        """
+        self.indices.extend(indices)
+        self.pages.extend([isinstance(page, str) and intern(page) or page
+                           for page in pages])
+        offsets = []
+        offset = self.offsets[-1]
+        for count in counts:
+            offset += count
+            offsets.append(offset)
+        self.offsets.extend(offsets)
+        self.runs.extend(runs)
+
+    def series(self):
+        """the runs of each page, as lists"""
+        runs = self.runs
+        offsets = self.offsets
+        return [runs[offsets[i]:offsets[i+1]].tolist() for i in range(len(self.pages))]
+
+    def rows(self):
+        """the results as a list of {'index', 'page', 'runs'} dicts"""
+        return [dict(index=index, page=page, runs=runs)
+                for index, page, runs in zip(self.indices, self.pages, self.series())]
+
+
 class Results(object):
+
+    __slots__ = ('counter_results', 'table', '_results', '_values')
+
+    def __init__(self, counter_results=None):
+        self.counter_results = counter_results
+        self.table = ResultsTable()
+        self._results = None
+        self._values = None # (filters, values) of the last call to values()
+
+    @property
+    def results(self):
+        """the results as a list of {'index', 'page', 'runs'} dicts,
+        made from the table when first needed"""
+        if self._results is None:
+            self._results = self.table.rows()
+        return self._results
+
     def filter(self, *filters):
         """
         filter the results set;
@@ -150,21 +302,21 @@ class Results(object):
         the last filter should return a scalar (float or int)
         returns a list of [[data, page], ...]
         """
-        retval = []
-        for result in self.results:
-            page = result['page']
-            data = result['runs']
-            data = filter.apply(data, filters)
-            retval.append([data, page])
-        return retval
+        data = filter.apply_batch(self.table.series(), filters)
+        return [[value, page] for value, page in zip(data, self.table.pages)]
 
     def raw_values(self):
-        return [(result['page'], result['runs']) for result in self.results]
+        return zip(self.table.pages, self.table.series())
 
     def values(self, filters):
-        """return filtered (value, page) for each value"""
-        return [[val, page] for val, page in self.filter(*filters)
-                if val > -1]
+        """return filtered (value, page) for each value;
+        the values for the last filters asked for are kept, as each output
+        asks for the same ones"""
+        key = filter.normalize(filters)
+        if self._values is None or self._values[0] != key:
+            self._values = (key, [[val, page] for val, page in self.filter(*filters)
+                                  if val > -1])
+        return [list(value) for value in self._values[1]]
 
 
 class TsResults(Results):
@@ -172,39 +324,41 @@ class TsResults(Results):
     results for Ts tests
     """
 
+    __slots__ = ()
+
     format = 'tsformat'
 
     def __init__(self, string, counter_results=None):
-        self.counter_results = counter_results
+        Results.__init__(self, counter_results)
 
         string = string.strip()
         lines = string.splitlines()
 
         # gather the data
-        self.results = []
-        index = 0
+        pages = []
+        counts = []
+        fields = []
 
         # Handle the case where we support a pagename in the results (new format)
         for line in lines:
-            result = {}
             r = line.strip().split(',')
-            r = [i for i in r if i]
+            if '' in r:
+                r = [i for i in r if i]
             if len(r) <= 1:
                 continue
-            result['index'] = index
-            result['page'] = r[0]
             #note: if we have len(r) >1, then we have pagename,raw_results
-            result['runs'] = [float(i) for i in r[1:]]
-            self.results.append(result)
-            index += 1
+            pages.append(r[0])
+            counts.append(len(r) - 1)
+            fields.extend(r[1:])
 
         # The original case where we just have numbers and no pagename
-        if not self.results:
-            result = {}
-            result['index'] = index
-            result['page'] = 'NULL'
-            result['runs'] = [float(val) for val in string.split('|')]
-            self.results.append(result)
+        if not pages:
+            pages.append('NULL')
+            fields = string.split('|')
+            counts.append(len(fields))
+
+        # convert all the runs in one go
+        self.table.extend(range(len(pages)), pages, counts, parse_floats(fields))
 
 
 class PageloaderResults(Results):
@@ -213,6 +367,8 @@ class PageloaderResults(Results):
     https://wiki.mozilla.org/Buildbot/Talos/DataFormat#browser_output.txt
     """
 
+    __slots__ = ()
+
     format = 'tpformat'
 
     def __init__(self, string, counter_results=None):
@@ -221,7 +377,7 @@ class PageloaderResults(Results):
         - counter_results : counter results dictionary
         """
 
-        self.counter_results = counter_results
+        Results.__init__(self, counter_results)
 
         string = string.strip()
         lines = string.splitlines()
@@ -233,21 +389,24 @@ class PageloaderResults(Results):
         lines = [line for line in lines if ';' in line]
 
         # gather the data
-        self.results = []
+        indices = []
+        pages = []
+        counts = []
+        fields = []
         for line in lines:
-            result = {}
             r = line.strip('|').split(';')
-            r = [i for i in r if i]
+            if '' in r:
+                r = [i for i in r if i]
             if len(r) <= 2:
                 continue
-            result['index'] = int(r[0])
-            result['page'] = r[1]
-            result['runs'] = [float(i) for i in r[2:]]
-
+            indices.append(int(r[0]))
             # fix up page
-            result['page'] = self.format_pagename(result['page'])
+            pages.append(self.format_pagename(r[1]))
+            counts.append(len(r) - 2)
+            fields.extend(r[2:])
 
-            self.results.append(result)
+        # convert all the runs in one go
+        self.table.extend(indices, pages, counts, parse_floats(fields))
 
     def format_pagename(self, page):
         """
@@ -273,14 +432,15 @@ class BrowserLogResults(object):
                    ('endTime', ('__startAfterTerminationTimestamp', '__endAfterTerminationTimestamp'))
                    ]
 
-    # regular expression for failure case if we can't parse the tokens
-    RESULTS_REGEX_FAIL = re.compile('__FAIL(.*?)__FAIL', re.DOTALL|re.MULTILINE)
+    # token delimiting the failure message if we can't parse the tokens
+    fail_token = '__FAIL'
 
-    # regular expression for RSS results
-    RSS_REGEX = re.compile('RSS:\s+([a-zA-Z0-9]+):\s+([0-9]+)$')
+    # regular expression for RSS results, one per line
+    rss_pattern = 'RSS:[^\S\n]+(?P<rss_type>[a-zA-Z0-9]+):[^\S\n]+(?P<rss_value>[0-9]+)$'
+    rss_counters = ['Main_RSS', 'Content_RSS']
 
     # regular expression for responsiveness results
-    RESULTS_RESPONSIVENESS_REGEX = re.compile('MOZ_EVENT_TRACE\ssample\s\d*?\s(\d*?)$', re.DOTALL|re.MULTILINE)
+    responsiveness_pattern = 'MOZ_EVENT_TRACE\ssample\s\d*?\s(?P<responsiveness>\d*?)$'
 
     # classes for results types
     classes = {'tsformat': TsResults,
@@ -289,9 +449,10 @@ class BrowserLogResults(object):
     # If we are using xperf, we do not upload the regular results, only xperf counters
     using_xperf = False
 
-    def __init__(self, filename=None, results_raw=None, counter_results=None, global_counters=None):
+    def __init__(self, filename=None, results_raw=None, counter_results=None, global_counters=None, scanner=None):
         """
         - shutdown : whether to record shutdown results or not
+        - scanner : a BrowserLogScanner which has already been fed the whole log
         """
 
         self.counter_results = counter_results
@@ -301,32 +462,18 @@ class BrowserLogResults(object):
             raise utils.talosError("Must specify filename or results_raw")
 
         self.filename = filename
-        if results_raw is None:
-            # read the file
-
-            if not os.path.isfile(filename):
-                raise utils.talosError("File '%s' does not exist" % filename)
-            f = file(filename)
-            exception = None
-            try:
-                results_raw = f.read()
-            except Exception, exception:
-                pass
-            try:
-                f.close()
-            except:
-                pass
-            if exception:
-                raise exception
-
         self.results_raw = results_raw
+        if results_raw is None and not os.path.isfile(filename):
+            raise utils.talosError("File '%s' does not exist" % filename)
 
         # parse the results
         try:
-            match = self.RESULTS_REGEX_FAIL.search(self.results_raw)
-            if match:
-                self.error(match.group(1))
-                raise utils.talosError(match.group(1))
+            if scanner is None:
+                self.scan()
+            else:
+                self.use_scanner(scanner)
+            if self.fail_token in self.scanner.parts:
+                self.error(self.scanner.parts[self.fail_token])
 
             self.parse()
         except utils.talosError:
@@ -342,6 +489,65 @@ class BrowserLogResults(object):
             message += ' [%s]' % self.filename
         raise utils.talosError(message)
 
+    _scan_regexes = {}
+
+    @classmethod
+    def scan_regex(cls, rss=False, responsiveness=False):
+        """returns a regular expression matching any of the tokens and,
+        optionally, RSS and responsiveness values"""
+        key = (cls, rss, responsiveness)
+        if key not in cls._scan_regexes:
+            tokens = [cls.fail_token]
+            for name, pair in cls.report_tokens + cls.time_tokens:
+                tokens.extend(pair)
+            tokens.sort(key=len, reverse=True)
+            # each alternative starts with a literal outside of any group, so
+            # that the regex engine can skip ahead to the characters they start
+            # with instead of trying every alternative at every character
+            prefix = os.path.commonprefix(tokens)
+            patterns = ['%s(?P<token>%s)' % (re.escape(prefix),
+                                             '|'.join([re.escape(token[len(prefix):])
+                                                       for token in tokens]))]
+            if rss:
+                patterns.append(cls.rss_pattern)
+            if responsiveness:
+                patterns.append(cls.responsiveness_pattern)
+            cls._scan_regexes[key] = re.compile('|'.join(patterns), re.DOTALL|re.MULTILINE)
+        return cls._scan_regexes[key]
+
+    @classmethod
+    def make_scanner(cls, counter_results=None, global_counters=None, rss=None, responsiveness=None):
+        """returns a BrowserLogScanner for the log, by default looking for the
+        RSS and responsiveness values that are to be recorded in these counters"""
+        if rss is None:
+            rss = bool(counter_results and
+                       set(cls.rss_counters).intersection(counter_results.keys()))
+        if responsiveness is None:
+            responsiveness = bool(global_counters and 'responsiveness' in global_counters)
+        return BrowserLogScanner(cls, rss, responsiveness)
+
+    def scan(self, rss=None, responsiveness=None):
+        """read the log from results_raw or the file a chunk at a time,
+        finding the tokens and, by default, the RSS and responsiveness values
+        that are to be recorded"""
+        scanner = self.make_scanner(self.counter_results, self.global_counters, rss, responsiveness)
+        if self.results_raw is not None:
+            scanner.feed(self.results_raw)
+        else:
+            f = file(self.filename)
+            try:
+                scanner.read(f)
+            finally:
+                f.close()
+        scanner.finish()
+        self.use_scanner(scanner)
+
+    def use_scanner(self, scanner):
+        """take the tokens and values found in the log from scanner"""
+        self.scanner = scanner
+        self.rss_values = scanner.rss_values
+        self.responsiveness_values = scanner.responsiveness_values
+
     def parse(self):
         position = -1
 
@@ -380,15 +586,17 @@ class BrowserLogResults(object):
 
     def get_single_token(self, start_token, end_token):
         """browser logs should only have a single instance of token pairs"""
+        starts = self.scanner.tokens[start_token]
+        ends = self.scanner.tokens[end_token]
         try:
-            parts, last_token = utils.tokenize(self.results_raw, start_token, end_token)
+            found = utils.check_token_positions(start_token, end_token, starts, ends)
         except AssertionError, e:
             self.error(str(e))
-        if not parts:
+        if not found:
             return None, -1 # no match
-        if len(parts) != 1:
+        if len(starts) != 1:
             self.error("Multiple matches for %s,%s" % (start_token, end_token))
-        return parts[0], last_token
+        return self.scanner.parts[start_token], ends[-1]
 
     def results(self):
         """return results instance appropriate to the format detected"""
@@ -488,25 +696,112 @@ class BrowserLogResults(object):
     def rss(self, counter_results):
         """record rss counters in counter_results dictionary"""
 
-        counters = ['Main', 'Content']
-        if not set(['%s_RSS' % i for i in counters]).intersection(counter_results.keys()):
+        if not set(self.rss_counters).intersection(counter_results.keys()):
             # no RSS counters to accumulate
             return
-        for line in self.results_raw.split('\n'):
-            rssmatch = self.RSS_REGEX.search(line)
-            if rssmatch:
-                (type, value) = (rssmatch.group(1), rssmatch.group(2))
-                # type will be 'Main' or 'Content'
-                counter_name = '%s_RSS' % type
-                if counter_name in counter_results:
-                    counter_results[counter_name].append(value)
+        if self.rss_values is None:
+            # not looked for when the log was parsed
+            self.scan(rss=True, responsiveness=self.responsiveness_values is not None)
+        for type, value in self.rss_values:
+            # type will be 'Main' or 'Content'
+            counter_name = '%s_RSS' % type
+            if counter_name in counter_results:
+                counter_results[counter_name].append(value)
 
     def shutdown(self, counter_results):
         """record shutdown time in counter_results dictionary"""
         counter_results.setdefault('shutdown', []).append(int(self.endTime - self.startTime))
 
     def responsiveness(self):
-        return self.RESULTS_RESPONSIVENESS_REGEX.findall(self.results_raw)
+        if self.responsiveness_values is None:
+            # not looked for when the log was parsed
+            self.scan(rss=self.rss_values is not None, responsiveness=True)
+        return self.responsiveness_values
+
+
+class BrowserLogScanner(object):
+    """
+    scans a browser log for the tokens of a BrowserLogResults class as it is
+    fed, keeping only the text between tokens and the counter values, so
+    that the whole log never has to be held in memory
+    """
+
+    chunk_size = 1 << 16
+
+    def __init__(self, results_class=BrowserLogResults, rss=False, responsiveness=False):
+        self.regex = results_class.scan_regex(rss, responsiveness)
+        pairs = [pair for name, pair in results_class.report_tokens + results_class.time_tokens]
+        pairs.append((results_class.fail_token, results_class.fail_token))
+        self.start_tokens = set([start for start, end in pairs])
+        self.end_tokens = dict([(end, start) for start, end in pairs]) # end -> start token
+        self.tokens = {} # token -> character positions
+        for pair in pairs:
+            for token in pair:
+                self.tokens[token] = []
+        self.prefix = os.path.commonprefix(self.tokens.keys())
+        self.parts = {} # start token -> text up to the first end token
+        self.captures = {} # start token -> [pieces of text so far, position in the current block]
+        self.rss_values = self.responsiveness_values = None
+        if rss:
+            self.rss_values = []
+        if responsiveness:
+            self.responsiveness_values = []
+        self.position = 0 # character position of the start of the next block
+        self.partial = '' # an incomplete last line
+
+    def feed(self, data):
+        """scan data from the log; only complete lines are scanned until finish()"""
+        data = self.partial + data
+        end = data.rfind('\n') + 1
+        self.partial = data[end:]
+        if end:
+            self.scan(data[:end])
+
+    def read(self, f):
+        """scan the rest of the file object f"""
+        for chunk in iter(lambda: f.read(self.chunk_size), ''):
+            self.feed(chunk)
+
+    def finish(self):
+        """scan the remainder of the log"""
+        if self.partial:
+            self.scan(self.partial)
+            self.partial = ''
+
+    def text(self, start_token):
+        """returns the text following start_token up to its end token, or
+        the complete lines of it scanned so far if the end token hasn't been
+        seen yet; None if start_token hasn't been seen"""
+        if start_token in self.parts:
+            return self.parts[start_token]
+        if start_token in self.captures:
+            return ''.join(self.captures[start_token][0])
+        return None
+
+    def scan(self, block):
+        # tokens can't span lines, so neither can they span blocks
+        for match in self.regex.finditer(block):
+            group = match.lastgroup
+            if group == 'token':
+                token = self.prefix + match.group(group)
+                self.tokens[token].append(self.position + match.start())
+                start = self.end_tokens.get(token)
+                if start in self.captures:
+                    pieces, begin = self.captures.pop(start)
+                    pieces.append(block[begin:match.start()])
+                    self.parts[start] = ''.join(pieces)
+                elif token in self.start_tokens and token not in self.parts:
+                    # only the first instance of a token is kept; the
+                    # positions tell whether there were others
+                    self.captures[token] = [[], match.end()]
+            elif group == 'rss_value':
+                self.rss_values.append((match.group('rss_type'), match.group(group)))
+            else:
+                self.responsiveness_values.append(match.group(group))
+        for capture in self.captures.values():
+            capture[0].append(block[capture[1]:])
+            capture[1] = 0
+        self.position += len(block)
 
 
 def main(args=sys.argv[1:]):
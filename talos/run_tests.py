@@ -155,7 +155,7 @@ def run_tests(configurator):
   # data filters
   filters = config['filters']
   try:
-      filters = filter.filters_args(filters)
+      filters = filter.pipeline(filters)
   except AssertionError, e:
       raise talosError(str(e))
 
@@ -182,7 +182,7 @@ def run_tests(configurator):
     # ensure test-specific filters are valid
     if 'filters' in test:
       try:
-        filter.filters_args(test['filters'])
+        filter.pipeline(test['filters'])
       except AssertionError, e:
         raise talosError(str(e))
       except IndexError, e:
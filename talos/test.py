@@ -57,7 +57,8 @@ class Test(object):
 
 class TsBase(Test):
     """abstract base class for ts-style tests"""
-    keys = ['url', 'url_timestamp', 'timeout', 'cycles', 'shutdown', 'profile_path', 'xperf_counters',
+    keys = ['url', 'url_timestamp', 'timeout', 'cycles', 'converge_threshold', 'min_cycles',
+            'shutdown', 'profile_path', 'xperf_counters',
             'xperf_providers', 'xperf_user_providers', 'xperf_stackwalk']
 
 class ts(TsBase):
@@ -25,7 +25,10 @@ import tempfile
 import time
 import utils
 import copy
+import filter
+import wait
 import mozcrash
+from cmanager import CounterSeries
 
 try:
     import mozdevice
@@ -210,10 +213,11 @@ class TTest(object):
                 cm.stopMonitor()
 
             if os.path.isfile(browser_config['browser_log']):
+                # log it a block of lines at a time rather than reading it all
                 results_file = open(browser_config['browser_log'], "r")
-                results_raw = results_file.read()
+                for lines in iter(lambda: results_file.readlines(1 << 16), []):
+                    utils.info(''.join(lines).rstrip('\n'))
                 results_file.close()
-                utils.info(results_raw)
 
             if profile_dir:
                 try:
@@ -312,6 +316,15 @@ class TTest(object):
             # instantiate an object to hold test results
             test_results = results.TestResults(test_config, global_counters, extensions=self._ffsetup.extensions)
 
+            # adaptive mode: stop running cycles once the results converge
+            converge_threshold = test_config.get('converge_threshold')
+            if converge_threshold:
+                min_cycles = test_config.get('min_cycles') or 5
+                try:
+                    converge_filters = filter.pipeline(test_config.get('filters') or browser_config['filters'])
+                except AssertionError, e:
+                    raise talosError(str(e))
+
             for i in range(test_config['cycles']):
 
                 # remove the browser log file
@@ -326,7 +339,9 @@ class TTest(object):
 
                 # on remote devices we do not have the fast launch/shutdown as we do on desktop
                 if not browser_config['remote']:
-                    time.sleep(browser_config['browser_wait']) #wait out the browser closing
+                    #wait out the browser closing
+                    wait.until(lambda: not self._ffprocess.checkAllProcesses(browser_config['process'], browser_config['child_process']),
+                               browser_config['browser_wait'])
 
                 # check to see if the previous cycle is still hanging around
                 if (i > 0) and self._ffprocess.checkAllProcesses(browser_config['process'], browser_config['child_process']):
@@ -363,34 +378,55 @@ class TTest(object):
                 # some time for the browser to start we have trouble connecting the CounterManager to it
                 # on remote devices we do not have the fast launch/shutdown as we do on desktop
                 if not browser_config['remote']:
-                    time.sleep(browser_config['browser_wait'])
+                    # wait for the browser process to appear (or the controller to give up)
+                    wait.until(lambda: (process.poll() is not None) or
+                                       self._ffprocess.ProcessesWithNames(browser_config['process']),
+                               browser_config['browser_wait'])
 
                 #set up the counters for this test
                 counter_results = None
                 if counters:
                     cm = self.CounterManager(self._ffprocess, browser_config['process'], counters)
-                    counter_results = dict([(counter, []) for counter in counters])
-
-                #the main test loop, monitors counters and checks for browser output
-                dumpResult = ""
-                while total_time < timeout:
-                    # Sleep for [resolution] seconds
-                    time.sleep(resolution)
-                    total_time += resolution
-                    fileData = self._ffprocess.getFile(b_log)
-                    if fileData and len(fileData) > 0:
-                        newResults = fileData.replace(dumpResult, '')
+                    counter_results = dict([(counter, CounterSeries()) for counter in counters])
+                    # sample every resolution seconds, keeping enough samples for the whole timeout
+                    cm.startMonitor(resolution, int(timeout / resolution) + 1)
+
+                # parse the browser output as it is written; remote logs are
+                # parsed once they have been copied back
+                if not self.remote:
+                    test_results.start_cycle(counter_results)
+
+                #the main test loop, checks for browser output while the counters are sampled in the background
+                log_offset = 0
+                cut_short = False
+                waiter = wait.Waiter()
+                waiter.watch_process(process.pid)
+                try:
+                    while total_time < timeout:
+                        # Sleep for [resolution] seconds, or until browser_controller exits
+                        waiter.wait(resolution)
+                        total_time += resolution
+                        newResults, log_offset = self._ffprocess.tailFile(b_log, log_offset)
                         if len(newResults.strip()) > 0:
                             utils.info(newResults)
-                            dumpResult = fileData
-
-                    # Get the output from all the possible counters
-                    for count_type in counters:
-                        val = cm.getCounterValue(count_type)
-                        if val:
-                            counter_results[count_type].append(val)
-                    if process.poll() != None: #browser_controller completed, file now full
-                        break
+                        if not self.remote:
+                            test_results.scan(newResults)
+                            if test_results.failure() is not None:
+                                # no need to wait for the rest of the cycle
+                                cut_short = True
+                                break
+
+                        if process.poll() != None: #browser_controller completed, file now full
+                            break
+                finally:
+                    waiter.close()
+
+                if not self.remote:
+                    # pick up anything written since the last read
+                    newResults, log_offset = self._ffprocess.tailFile(b_log, log_offset)
+                    if len(newResults.strip()) > 0:
+                        utils.info(newResults)
+                    test_results.scan(newResults)
 
                 if hasattr(process, 'kill'):
                     # BBB python 2.4 does not have Popen.kill(); see
@@ -402,12 +438,18 @@ class TTest(object):
                             # 3 == No such process in Linux and Mac (errno.h)
                             raise
 
+                if cut_short:
+                    # killing browser_controller leaves the browser running
+                    self._ffprocess.cleanupProcesses(browser_config['process'],
+                                                     browser_config['child_process'],
+                                                     browser_config['browser_wait'])
+
                 if total_time >= timeout:
                     raise talosError("timeout exceeded")
 
                 #stop the counter manager since this test is complete
                 if counters:
-                    cm.stopMonitor()
+                    counter_results.update(cm.stopMonitor())
 
                 # ensure the browser log exists
                 browser_log_filename = browser_config['browser_log']
@@ -423,15 +465,19 @@ class TTest(object):
 
                 # on remote devices we do not have the fast launch/shutdown as we do on desktop
                 if not browser_config['remote']:
-                    time.sleep(browser_config['browser_wait'])
+                    # wait for the browser to finish shutting down
+                    wait.until(lambda: not self._ffprocess.checkAllProcesses(browser_config['process'], browser_config['child_process']),
+                               browser_config['browser_wait'])
 
                 #clean up any stray browser processes
                 self.cleanupAndCheckForCrashes(browser_config, profile_dir, test_config['name'])
                 #clean up the bcontroller process
-                timer = 0
-                while ((process.poll() is None) and timer < browser_config['browser_wait']):
-                    time.sleep(1)
-                    timer+=1
+                wait.until(lambda: process.poll() is not None, browser_config['browser_wait'])
+
+                if converge_threshold and (i + 1) >= min_cycles:
+                    if test_results.converged(converge_filters, converge_threshold):
+                        utils.info("%s: results converged after %d of %d cycles", test_config['name'], i + 1, test_config['cycles'])
+                        break
 
             # cleanup
             self.cleanupProfile(temp_dir)
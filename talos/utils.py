@@ -6,14 +6,17 @@
 
 import os
 import shlex
+import shutil
 import subprocess
 import sys
 import time
 import urlparse
 import yaml
 import string
+import zlib
 import mozlog
 from mozlog import debug,info
+from zipfile import ZipFile
 
 # directory of this file for use with interpolatePath()
 here = os.path.dirname(os.path.realpath(__file__))
@@ -24,6 +27,30 @@ START_TIME = 0
 saved_environment = {}
 log_levels = {'debug': mozlog.DEBUG, 'info': mozlog.INFO}
  
+# clock_gettime(CLOCK_MONOTONIC), for timestamps unaffected by changes to
+# the system time; python 2 has no time.monotonic()
+_clock_gettime = None
+if sys.platform.startswith('linux'):
+  try:
+    import ctypes
+    import ctypes.util
+    class _timespec(ctypes.Structure):
+      _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+    _clock_gettime = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6').clock_gettime
+  except (ImportError, OSError, AttributeError):
+    _clock_gettime = None
+CLOCK_MONOTONIC = 1
+
+def monotonic():
+  """returns seconds from a monotonic clock where available,
+  or from time.time() otherwise"""
+  if _clock_gettime is None:
+    return time.time()
+  t = _timespec()
+  if _clock_gettime(CLOCK_MONOTONIC, ctypes.byref(t)):
+    return time.time()
+  return t.tv_sec + t.tv_nsec * 1e-9
+
 def startTimer():
   global START_TIME
   START_TIME = time.time()
@@ -101,22 +128,85 @@ def readConfigFile(filename):
   config_file.close()
   return yaml_config
 
-def zip_extractall(zipfile, rootdir):
+def _zip_member_unchanged(member, destfile, chunk_size):
+  """whether destfile already holds the contents of the zip member"""
+  try:
+    if os.path.getsize(destfile) != member.file_size:
+      return False
+  except OSError:
+    return False
+  crc = 0
+  f = open(destfile, 'rb')
+  for chunk in iter(lambda: f.read(chunk_size), ''):
+    crc = zlib.crc32(chunk, crc)
+  f.close()
+  return (crc & 0xffffffff) == member.CRC
+
+def _zip_extract_members(zipfile, members, rootdir, chunk_size):
+  for member in members:
+    destfile = os.path.join(rootdir, member.filename)
+    if _zip_member_unchanged(member, destfile, chunk_size):
+      continue
+    f = open(destfile, 'wb')
+    if hasattr(zipfile, 'open'):
+      source = zipfile.open(member)
+      shutil.copyfileobj(source, f, chunk_size)
+      source.close()
+    else:
+      # ZipFile.open is new in python 2.6
+      f.write(zipfile.read(member.filename))
+    f.close()
+
+def zip_extractall(zipfile, rootdir, threads=1, chunk_size=1<<16):
   #moved from ffsetup.py only required for python versions lower than 2.6
-  """Python 2.4 compatibility instead of ZipFile.extractall."""
-  for name in zipfile.namelist():
-    if name.endswith('/'):
-      if not os.path.exists(os.path.join(rootdir, name)):
-        os.makedirs(os.path.join(rootdir, name))
+  """Python 2.4 compatibility instead of ZipFile.extractall.
+  Members are copied chunk_size bytes at a time, and members which are
+  already on disk with the same size and CRC are left alone.  With
+  threads > 1, members are extracted concurrently where multiprocessing
+  is available; this needs zipfile to have been opened by filename.
+  """
+  members = []
+  for member in zipfile.infolist():
+    path = os.path.join(rootdir, member.filename)
+    if member.filename.endswith('/'):
+      destdir = path
     else:
-      destfile = os.path.join(rootdir, name)
-      destdir = os.path.dirname(destfile)
-      if not os.path.isdir(destdir):
-        os.makedirs(destdir)
-      data = zipfile.read(name)
-      f = open(destfile, 'wb')
-      f.write(data)
-      f.close()
+      destdir = os.path.dirname(path)
+      members.append(member)
+    if not os.path.isdir(destdir):
+      os.makedirs(destdir)
+
+  ThreadPool = None
+  if threads > 1 and len(members) > 1 and zipfile.filename:
+    try:
+      # multiprocessing is new in python 2.6
+      from multiprocessing.pool import ThreadPool
+    except ImportError:
+      pass
+  if ThreadPool is None:
+    _zip_extract_members(zipfile, members, rootdir, chunk_size)
+    return
+
+  # a ZipFile can't be read from several threads at once, so each thread
+  # opens its own; balance the threads by compressed size
+  groups = [[] for i in range(min(threads, len(members)))]
+  sizes = [0] * len(groups)
+  for member in sorted(members, key=lambda member: member.compress_size, reverse=True):
+    index = sizes.index(min(sizes))
+    groups[index].append(member)
+    sizes[index] += member.compress_size
+  def extract(members):
+    z = ZipFile(zipfile.filename)
+    try:
+      _zip_extract_members(z, members, rootdir, chunk_size)
+    finally:
+      z.close()
+  pool = ThreadPool(len(groups))
+  try:
+    pool.map(extract, groups)
+  finally:
+    pool.close()
+    pool.join()
 
 def _parse_ps(_ps_output):
   """parse the output of the ps command"""
@@ -136,36 +226,94 @@ def _parse_ps(_ps_output):
         stat_index = header.index('STAT')
         split.insert(stat_index, '')
       else:
-        print >> sys.stderr, "ps %s output:" % arg
+        print >> sys.stderr, "ps output:"
         print >> sys.stderr, _ps_output
         raise talosError("ps line, '%s', does not match headers: %s" % (line, header))
     process_dict = dict(zip(header, split))
     retval.append(process_dict)
   return retval
 
-def ps(arg='axwww'):
+# whether to read the `ps axwww` process table from /proc instead of running ps
+proc_table = sys.platform.startswith('linux') and os.path.isdir('/proc')
+
+_ps_cache = {} # ps argument -> (time, process table)
+_ps_output = '' # last ps output, for diagnostics
+# ps shows control characters in command lines as '?'
+_ps_unprintable = string.maketrans(''.join([chr(i) for i in range(32)]), '?' * 32)
+
+def _proc_ps():
+  """read the process table from /proc in the format of `ps axwww`"""
+  retval = []
+  for pid in os.listdir('/proc'):
+    if not pid.isdigit():
+      continue
+    try:
+      f = open('/proc/%s/stat' % pid)
+      stat = f.read()
+      f.close()
+      f = open('/proc/%s/cmdline' % pid)
+      cmdline = f.read()
+      f.close()
+    except (IOError, OSError):
+      # the process exited while the table was being read
+      continue
+
+    # the command name is parenthesized and may itself contain spaces or parentheses
+    end = stat.rindex(')')
+    name = stat[stat.index('(') + 1:end]
+    state = stat[end + 2:].split(None, 1)[0]
+    cmdline = cmdline.rstrip('\0')
+    if cmdline and state != 'Z':
+      command = ' '.join(cmdline.split('\0')).translate(_ps_unprintable)
+    else:
+      # kernel threads and zombies have no command line
+      command = '[%s]' % name
+      if state == 'Z':
+        command += ' <defunct>'
+    retval.append({'PID': pid, 'STAT': state, 'COMMAND': command})
+  return retval
+
+def ps(arg='axwww', ttl=0):
   """
   python front-end to `ps`
   http://en.wikipedia.org/wiki/Ps_%28Unix%29
+
+  On Linux the `ps axwww` table is read from /proc rather than forking ps.
+  - ttl: reuse a table read less than ttl seconds ago
   """
   global _ps_output # last ps output, for diagnostics
-  process = subprocess.Popen(['ps', arg], stdout=subprocess.PIPE)
-  _ps_output, _ = process.communicate()
-  return _parse_ps(_ps_output)
+  now = time.time()
+  if ttl and arg in _ps_cache:
+    timestamp, table = _ps_cache[arg]
+    if 0 <= now - timestamp < ttl:
+      return table
+
+  if proc_table and arg == 'axwww':
+    table = _proc_ps()
+    _ps_output = '\n'.join(['%5s %-4s %s' % ('PID', 'STAT', 'COMMAND')] +
+                           ['%5s %-4s %s' % (process['PID'], process['STAT'], process['COMMAND'])
+                            for process in table]) + '\n'
+  else:
+    process = subprocess.Popen(['ps', arg], stdout=subprocess.PIPE)
+    _ps_output, _ = process.communicate()
+    table = _parse_ps(_ps_output)
+  _ps_cache[arg] = (now, table)
+  return table
 
 def is_running(pid, psarg='axwww'):
   """returns if a pid is running"""
   return bool([i for i in ps(psarg) if pid == int(i['PID'])])
 
-def running_processes(name, psarg='axwww', defunct=False):
+def running_processes(name, psarg='axwww', defunct=False, ttl=0):
   """
   returns a list of 2-tuples of running processes:
   (pid, ['path/to/executable', 'args', '...'])
   with the executable named `name`.
   - defunct: whether to return defunct processes
+  - ttl: reuse a process table read less than ttl seconds ago
   """
   retval = []
-  for process in ps(psarg):
+  for process in ps(psarg, ttl=ttl):
     command = process.get('COMMAND', process.get('CMD'))
     if command is None:
       print >> sys.stderr, "ps %s output:" % psarg
@@ -214,40 +362,19 @@ def testAgent(host, port):
     from mozdevice import devicemanagerSUT
     return devicemanagerSUT.DeviceManagerSUT(host, port)
 
-def findall(string, token):
-  """find all occurances in a string"""
-  # really, should be in python core
-  retval = []
-  while True:
-    if retval:
-      index = retval[-1] + len(token)
-    else:
-      index = 0
-    location = string.find(token, index)
-    if location == -1:
-      return retval
-    retval.append(location)
-
-def tokenize(string, start, end):
+def check_token_positions(start, end, _start, _end):
   """
-  tokenize a string by start + end tokens,
-  returns parts and position of last token
+  check that the positions of start + end tokens pair up,
+  returns whether any were found
   """
-  assert end not in start, "End token '%s' is contained in start token '%s'" % (end, start)
-  assert start not in end, "Start token '%s' is contained in end token '%s'" % (start, end)
-  _start = findall(string, start)
-  _end = findall(string, end)
   if not _start and not _end:
-      return [], -1
+      return False
   assert len(_start), "Could not find start token: '%s'" % start
   assert len(_end), "Could not find end token: '%s'" % end
   assert len(_start) == len(_end), "Unmatched number of tokens found: '%s' (%d) vs '%s' (%d)" % (start, len(_start), end, len(_end))
   for i in range(len(_start)):
     assert _end[i] > _start[i], "End token '%s' occurs before start token '%s'" % (end, start)
-  parts = []
-  for i in range(len(_start)):
-    parts.append(string[_start[i] + len(start):_end[i]])
-  return parts, _end[-1]
+  return True
 
 # methods for introspecting network availability
 # Used for the --develop option where we dynamically create a webserver
@@ -0,0 +1,167 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""
+event-driven waits for file writes and process exit
+
+On Linux, files are watched with inotify(7), processes with
+pidfd_open(2) and in-process notifications with a pipe, so a wait
+returns as soon as any of them fires.  Elsewhere (or on kernels without
+these calls) Waiter.wait() simply sleeps for the timeout, which is what
+the polling loops using it did before.
+
+until() replaces fixed sleeps with a bounded wait for a condition.
+"""
+
+import errno
+import os
+import select
+import struct
+import sys
+import time
+
+libc = None
+if sys.platform.startswith('linux'):
+    try:
+        import ctypes
+        import ctypes.util
+        import fcntl
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        if not hasattr(libc, 'inotify_init1'):
+            libc = None
+    except (ImportError, OSError):
+        libc = None
+
+# see <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = 04000
+IN_CLOEXEC = 02000000
+# struct inotify_event, without its trailing name
+inotify_event = 'iIII'
+inotify_event_size = struct.calcsize(inotify_event)
+
+# the pidfd_open syscall number is shared by all architectures
+NR_pidfd_open = 434
+
+def until(condition, timeout, interval=0.1):
+    """poll condition() every interval seconds until it returns a true value
+    or timeout seconds have passed; returns the last value of condition()"""
+    end = time.time() + timeout
+    while True:
+        value = condition()
+        remaining = end - time.time()
+        if value or remaining <= 0:
+            return value
+        time.sleep(min(interval, remaining))
+
+def set_cloexec(fd):
+    """don't leak fd into browser processes started with os.system or Popen"""
+    flags = fcntl.fcntl(fd, fcntl.F_GETFD)
+    fcntl.fcntl(fd, fcntl.F_SETFD, flags | fcntl.FD_CLOEXEC)
+
+class Waiter(object):
+    """waits for any of a set of watched events, or a timeout"""
+
+    def __init__(self):
+        self.fds = [] # descriptors to select on
+        self.inotify = None
+        self.watched = set() # (watch descriptor, file name)
+
+    def watch_file(self, path):
+        """wake when path is created or written to;
+        returns False if the file cannot be watched"""
+        if libc is None:
+            return False
+        if self.inotify is None:
+            fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+            if fd < 0:
+                return False
+            self.inotify = fd
+            self.fds.append(fd)
+        # watch the directory, as the file is removed and recreated each cycle
+        dirname, filename = os.path.split(os.path.abspath(path))
+        wd = libc.inotify_add_watch(self.inotify, dirname,
+                                    IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE)
+        if wd < 0:
+            return False
+        self.watched.add((wd, filename))
+        return True
+
+    def watch_process(self, pid):
+        """wake when the process pid exits;
+        returns False if the process cannot be watched"""
+        if libc is None:
+            return False
+        fd = libc.syscall(NR_pidfd_open, pid, 0)
+        if fd < 0:
+            return False
+        self.fds.append(fd)
+        return True
+
+    def pipe(self):
+        """returns the write end of a pipe which wakes the waiter when written
+        to, or None if not supported; the writer is responsible for closing it"""
+        if libc is None:
+            return None
+        read_fd, write_fd = os.pipe()
+        set_cloexec(read_fd)
+        set_cloexec(write_fd)
+        self.fds.append(read_fd)
+        return write_fd
+
+    def _read_inotify(self):
+        """drain pending inotify events; returns whether any concern a watched file"""
+        try:
+            data = os.read(self.inotify, 65536)
+        except OSError, e:
+            if e.errno == errno.EAGAIN:
+                return False
+            raise
+        found = False
+        offset = 0
+        while offset + inotify_event_size <= len(data):
+            wd, mask, cookie, length = struct.unpack(inotify_event, data[offset:offset + inotify_event_size])
+            offset += inotify_event_size
+            name = data[offset:offset + length].rstrip('\0')
+            offset += length
+            if (mask & IN_Q_OVERFLOW) or (wd, name) in self.watched:
+                found = True
+        return found
+
+    def wait(self, timeout):
+        """wait up to timeout seconds for a watched event;
+        returns True if woken by an event, False on timeout"""
+        if not self.fds:
+            time.sleep(timeout)
+            return False
+        end = time.time() + timeout
+        while True:
+            remaining = end - time.time()
+            if remaining <= 0:
+                return False
+            try:
+                ready = select.select(self.fds, [], [], remaining)[0]
+            except select.error, e:
+                if e[0] == errno.EINTR:
+                    continue
+                raise
+            if not ready:
+                return False
+            for fd in ready:
+                if fd != self.inotify or self._read_inotify():
+                    return True
+
+    def close(self):
+        for fd in self.fds:
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+        self.fds = []
+        self.inotify = None
+        self.watched = set()
@@ -7,7 +7,7 @@ test talos browser output parsing
 import os
 import unittest
 
-from talos.results import BrowserLogResults
+from talos.results import BrowserLogResults, BrowserLogScanner
 from talos.results import PageloaderResults
 from talos.utils import talosError
 
@@ -139,6 +139,57 @@ __startAfterTerminationTimestamp1333663596551__endAfterTerminationTimestamp
 
         self.compare_error_message(bad_report, "Multiple matches for %s,%s" % (self.start_report(), self.end_report()))
 
+    def test_counters(self):
+        """test reading RSS and responsiveness values from the log"""
+
+        log = """__start_report392__end_report
+RSS: Main: 1000
+RSS: Content: 2000
+RSS: Main:
+3000
+MOZ_EVENT_TRACE sample 1333663595953 18
+MOZ_EVENT_TRACE sample 1333663596003 24
+__startTimestamp1333663595953__endTimestamp
+__startBeforeLaunchTimestamp1333663595557__endBeforeLaunchTimestamp
+__startAfterTerminationTimestamp1333663596551__endAfterTerminationTimestamp
+"""
+        counter_results = {'Main_RSS': []}
+        global_counters = {'responsiveness': [], 'shutdown': []}
+        b = BrowserLogResults(results_raw=log, counter_results=counter_results,
+                              global_counters=global_counters)
+        self.assertEqual(counter_results, {'Main_RSS': ['1000']})
+        self.assertEqual(global_counters['responsiveness'], ['18', '24'])
+        self.assertEqual(global_counters['shutdown'], [598])
+
+        # values are still found if they weren't asked for up front
+        b = BrowserLogResults(results_raw=log)
+        counter_results = {'Content_RSS': []}
+        b.rss(counter_results)
+        self.assertEqual(counter_results, {'Content_RSS': ['2000']})
+        self.assertEqual(b.responsiveness(), ['18', '24'])
+
+    def test_chunks(self):
+        """test that the log is parsed the same however it is split up"""
+
+        browser_tsvg = os.path.join(here, 'browser_output.tsvg.txt')
+        browser_log = BrowserLogResults(browser_tsvg)
+        log = file(browser_tsvg).read()
+        for size in (1, 7, 100, len(log)):
+            scanner = BrowserLogScanner()
+            for i in range(0, len(log), size):
+                scanner.feed(log[i:i+size])
+            scanner.finish()
+            self.assertEqual(scanner.tokens, browser_log.scanner.tokens)
+            self.assertEqual(scanner.parts, browser_log.scanner.parts)
+
+        # the report so far, before its end token arrives
+        end = log.index('__end_tp_report')
+        scanner = BrowserLogScanner()
+        scanner.feed(log[:end])
+        self.assertEqual(scanner.text('__start_tp_report'),
+                         log[log.index('__start_tp_report') + len('__start_tp_report'):log.rindex('\n', 0, end) + 1])
+        self.assertEqual(scanner.text('__startTimestamp'), None)
+
     def start_report(self):
         """return a start report token"""
         return BrowserLogResults.report_tokens[0][1][0] # start token
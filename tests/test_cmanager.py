@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+
+"""
+test talos' counter monitor:
+
+http://hg.mozilla.org/build/talos/file/tip/talos/cmanager.py
+"""
+
+import time
+import unittest
+from StringIO import StringIO
+from talos.cmanager import CounterManager, CounterSeries, RingBuffer
+
+class Counting(CounterManager):
+    """counts the samples taken"""
+
+    counterDict = {'count': None, 'nothing': None}
+
+    def __init__(self, counters):
+        CounterManager.__init__(self, None, 'firefox', counters)
+        self._loadCounters()
+        self.registerCounters(counters)
+        self.count = 0
+
+    def getCounterValue(self, counterName):
+        if counterName == 'count':
+            self.count += 1
+            return self.count
+
+class TestRingBuffer(unittest.TestCase):
+
+    def test_ring_buffer(self):
+        buffer = RingBuffer(3)
+        self.assertEqual(buffer.series().samples(), [])
+        buffer.append(0., 1)
+        buffer.append(.5, 2)
+        self.assertEqual(len(buffer), 2)
+        self.assertEqual(buffer.series().samples(), [(0., 1.), (.5, 2.)])
+
+        # once full, the oldest samples are overwritten
+        for i in range(3, 6):
+            buffer.append(i / 2., i)
+        self.assertEqual(len(buffer), 3)
+        self.assertEqual(buffer.series().samples(), [(1.5, 3.), (2., 4.), (2.5, 5.)])
+
+class TestCounterSeries(unittest.TestCase):
+
+    def test_series(self):
+        """a series behaves like the list of its values"""
+        series = CounterSeries([1, 2])
+        series.append('3', timestamp=0.5)
+        series.extend([4.5])
+        self.assertEqual(len(series), 4)
+        self.assertEqual(list(series), [1., 2., 3., 4.5])
+        self.assertEqual(series[0], 1.)
+        self.assertEqual(series.samples()[2], (0.5, 3.))
+        self.assertFalse(CounterSeries())
+
+    def test_serialize(self):
+        series = CounterSeries([1024, 2048.125])
+        self.assertEqual(series.datazilla(), [1024., 2048.125])
+        buffer = StringIO()
+        series.write_graphserver(buffer)
+        self.assertEqual(buffer.getvalue(), "0,1024.00,NULL\n1,2048.12,NULL\n")
+
+        # integer counters stay integers
+        series = CounterSeries([1024])
+        series.append(2048L, timestamp=0.5)
+        values = series.datazilla()
+        self.assertEqual(values, [1024, 2048])
+        self.assertEqual([type(value) for value in values], [int, int])
+        ring = RingBuffer(2)
+        for value in (1, 2, 3):
+            ring.append(value / 2., value)
+        self.assertEqual(repr(ring.series().datazilla()), '[2, 3]')
+        ring.append(2., 4.5)
+        self.assertEqual(ring.series().datazilla(), [3., 4.5])
+
+class TestMonitor(unittest.TestCase):
+
+    def test_monitor(self):
+        """sample counters on a background thread"""
+        cm = Counting(['count', 'nothing'])
+        cm.startMonitor(0.05)
+        time.sleep(0.5)
+        samples = cm.stopMonitor()
+
+        # counters without values have no samples
+        self.assertEqual(len(samples['nothing']), 0)
+
+        count = samples['count'].samples()
+        self.assertTrue(len(count) > 2)
+        self.assertEqual([value for timestamp, value in count],
+                         range(1, len(count) + 1))
+
+        # timestamps are relative to the start and on schedule
+        self.assertEqual(count[0][0] < 0.05, True)
+        timestamps = [timestamp for timestamp, value in count]
+        self.assertEqual(timestamps, sorted(timestamps))
+        for timestamp, value in count:
+            self.assertTrue(abs(timestamp - 0.05 * (value - 1)) < 0.05)
+
+        # no more samples are taken once stopped
+        self.assertEqual(cm.stopMonitor()['count'].samples(), count)
+
+    def test_monitor_error(self):
+        """an error while sampling is raised when the monitor is stopped"""
+        cm = Counting(['count'])
+        def fail(counterName):
+            raise IOError("No such file or directory: '/proc/1234/statm'")
+        cm.getCounterValue = fail
+        cm.startMonitor(0.05)
+        cm.monitorThread.join(5)
+        self.assertFalse(cm.monitorThread.isAlive())
+        self.assertRaises(IOError, cm.stopMonitor)
+
+        # the error is only raised once
+        self.assertEqual(len(cm.stopMonitor()['count']), 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+
+"""
+Tests for the linux memory counters:
+
+http://hg.mozilla.org/build/talos/file/tip/talos/cmanager_linux.py
+"""
+
+import os
+import sys
+import time
+import unittest
+import mozinfo
+from talos import cmanager_linux
+from talos.ffprocess_linux import LinuxProcess
+
+class TestMemoryCounters(unittest.TestCase):
+
+    def setUp(self):
+        self.pids = [os.getpid()]
+
+    def test_procfiles(self):
+        """counters read through kept-open files match fresh reads"""
+        if not mozinfo.isLinux:
+            return
+        procfiles = cmanager_linux.ProcFiles()
+        try:
+            # a list allocated in between would change both readings
+            rss = cmanager_linux.GetResidentSize(self.pids)
+            rss_procfiles = cmanager_linux.GetResidentSize(self.pids, procfiles)
+            self.assertTrue(abs(rss - rss_procfiles) < 1024 * 1024)
+            self.assertEqual(procfiles.fds.keys(), [(os.getpid(), 'statm')])
+
+            # reading again seeks back to the start
+            self.assertTrue(cmanager_linux.GetResidentSize(self.pids, procfiles) > 0)
+
+            # files of other processes are closed
+            procfiles.prune([])
+            self.assertEqual(procfiles.fds, {})
+        finally:
+            procfiles.close()
+
+    def test_private_bytes(self):
+        """statm's data field is the sum of the private, writeable mappings"""
+        if not (mozinfo.isLinux and cmanager_linux.statm_private):
+            return
+        private = cmanager_linux.GetPrivateBytes(self.pids)
+        cmanager_linux.statm_private = False
+        try:
+            maps_private = cmanager_linux.GetPrivateBytes(self.pids)
+        finally:
+            cmanager_linux.statm_private = True
+        self.assertTrue(abs(private - maps_private) < 1024 * 1024)
+
+class TestSampleAll(unittest.TestCase):
+
+    def test_sample_all(self):
+        """sample every counter with one read of each file"""
+        if not mozinfo.isLinux:
+            return
+        process = os.path.basename(sys.executable)
+        counters = ['RSS', 'Private Bytes', 'Minor Faults', 'Major Faults']
+        cm = cmanager_linux.LinuxCounterManager(LinuxProcess(), process, counters)
+        cm.primaryPid = os.getpid()
+
+        # count the reads of /proc files
+        reads = []
+        def read(fd, size):
+            reads.append(fd)
+            return _read(fd, size)
+        _read = os.read
+        os.read = read
+        try:
+            cm.sample_all()
+            values = cm.sample_all()
+        finally:
+            os.read = _read
+            cm.stopMonitor()
+
+        self.assertEqual(sorted(values.keys()), sorted(counters))
+        self.assertTrue(values['RSS'] > 0)
+        self.assertTrue(values['Minor Faults'] >= 0)
+
+        # each sample reads statm and stat once per process
+        self.assertEqual(len(reads), 2 * 2 * len(cm.pidList))
+
+class TestRateCounters(unittest.TestCase):
+
+    def test_rates(self):
+        """rate counters report the change since the previous sample"""
+        if not mozinfo.isLinux:
+            return
+        pids = [os.getpid()]
+        procfiles = cmanager_linux.ProcFiles()
+        try:
+            counters = [cmanager_linux.GetCPUPercent,
+                        cmanager_linux.GetMinorFaults,
+                        cmanager_linux.GetMajorFaults,
+                        cmanager_linux.GetVoluntaryContextSwitches,
+                        cmanager_linux.GetInvoluntaryContextSwitches,
+                        cmanager_linux.GetReadBytes,
+                        cmanager_linux.GetWriteBytes]
+
+            # there is no rate until the second sample
+            for counter in counters:
+                self.assertEqual(counter(pids, procfiles), None)
+
+            # use some CPU time, however busy the machine is, and fault in some memory
+            start = sum(os.times()[:2])
+            end = time.time() + 10
+            while sum(os.times()[:2]) - start < 0.1 and time.time() < end:
+                data = ' ' * 1024 * 1024
+
+            values = [counter(pids, procfiles) for counter in counters]
+            for value in values:
+                self.assertTrue(value >= 0)
+            cpu, minflt = values[:2]
+            # the share of a CPU depends on the load of the machine
+            self.assertTrue(cpu > 0)
+            self.assertTrue(minflt > 0)
+        finally:
+            procfiles.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+
+"""
+test talos' ffprocess module:
+
+http://hg.mozilla.org/build/talos/file/tip/talos/ffprocess.py
+"""
+
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import unittest
+import mozinfo
+from talos.ffprocess import FFProcess
+from talos.ffprocess_linux import LinuxProcess
+
+class TestTailFile(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.log = os.path.join(self.tempdir, 'browser_output.txt')
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def write(self, data, mode='a'):
+        f = file(self.log, mode)
+        f.write(data)
+        f.close()
+
+    def test_tail(self):
+        """read only what has been appended to a log"""
+
+        ffprocess = FFProcess()
+
+        # a missing file has no data
+        self.assertEqual(ffprocess.tailFile(self.log), ('', 0))
+
+        self.write('__start_report')
+        data, offset = ffprocess.tailFile(self.log)
+        self.assertEqual(data, '__start_report')
+
+        # nothing new
+        self.assertEqual(ffprocess.tailFile(self.log, offset), ('', offset))
+
+        self.write('392__end_report\n')
+        data, offset = ffprocess.tailFile(self.log, offset)
+        self.assertEqual(data, '392__end_report\n')
+        self.assertEqual(ffprocess.getFile(self.log), '__start_report392__end_report\n')
+
+        # a replaced, shorter file is read from the beginning
+        self.write('__FAIL', 'w')
+        self.assertEqual(ffprocess.tailFile(self.log, offset), ('__FAIL', len('__FAIL')))
+
+class TestTerminateProcess(unittest.TestCase):
+
+    def test_terminate(self):
+        """terminating a process does not wait out the full timeout"""
+        if not mozinfo.isLinux:
+            return
+        process = subprocess.Popen(['sleep', '30'])
+        # reap the process as the browser controller would
+        reaper = threading.Thread(target=process.wait)
+        reaper.start()
+
+        start = time.time()
+        self.assertEqual(LinuxProcess()._TerminateProcess(process.pid, 30),
+                         'killed with SIGABRT')
+        self.assertTrue(time.time() - start < 10)
+        reaper.join()
+
+if __name__ == '__main__':
+    unittest.main()
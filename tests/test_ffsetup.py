@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+
+"""
+Tests for talos.ffsetup
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+from talos import ffsetup as ffsetup_module
+from talos.ffsetup import FFSetup
+from xml.dom import minidom
+
+class TestProfileCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.source = os.path.join(self.tempdir, 'base_profile')
+        os.makedirs(os.path.join(self.source, 'chrome'))
+        f = file(os.path.join(self.source, 'prefs.js'), 'w')
+        f.write('user_pref("browser.shell.checkDefaultBrowser", false);\n')
+        f.close()
+        self.ffsetup = FFSetup(None)
+        self.ffsetup.profile_cache = os.path.join(self.tempdir, 'cache')
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_cached_profile(self):
+        """test that a prepared profile is built once and cloned per test"""
+
+        prefs = {'dom.max_script_run_time': 0}
+        cached, addon_ids = self.ffsetup.CachedProfile(self.source, prefs, [], 'localhost')
+        self.assertEqual(addon_ids, [])
+        self.assertEqual(file(os.path.join(cached, 'user.js')).read(),
+                         'user_pref("dom.max_script_run_time", 0);\n')
+        self.assertTrue(os.path.isdir(os.path.join(cached, 'extensions', 'staged')))
+        self.assertEqual(len(os.listdir(self.ffsetup.profile_cache)), 1)
+
+        # the same inputs reuse the cached profile
+        self.assertEqual(self.ffsetup.CachedProfile(self.source, prefs, [], 'localhost')[0], cached)
+
+        # different prefs get a profile of their own
+        other = self.ffsetup.CachedProfile(self.source, {'dom.max_script_run_time': 1}, [], 'localhost')[0]
+        self.assertNotEqual(other, cached)
+        self.assertEqual(len(os.listdir(self.ffsetup.profile_cache)), 2)
+
+        # each test gets its own copy
+        temp_dir, profile_dir = self.ffsetup.CreateTempProfileDir(self.source, prefs, [], 'localhost')
+        try:
+            self.assertEqual(self.ffsetup.extensions, [])
+            self.assertEqual(sorted(os.listdir(profile_dir)), sorted(os.listdir(cached)))
+            f = file(os.path.join(profile_dir, 'prefs.js'), 'a')
+            f.write('user_pref("browser.startup.homepage", "about:blank");\n')
+            f.close()
+            self.assertNotEqual(file(os.path.join(profile_dir, 'prefs.js')).read(),
+                                file(os.path.join(cached, 'prefs.js')).read())
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_source_changed(self):
+        """test that changing the source profile invalidates the cache"""
+
+        cached = self.ffsetup.CachedProfile(self.source, {}, [], 'localhost')[0]
+        f = file(os.path.join(self.source, 'chrome', 'userChrome.css'), 'w')
+        f.write('\n')
+        f.close()
+        updated = self.ffsetup.CachedProfile(self.source, {}, [], 'localhost')[0]
+        self.assertNotEqual(updated, cached)
+        self.assertTrue(os.path.isfile(os.path.join(updated, 'chrome', 'userChrome.css')))
+
+        # the contents count, not the size and modification time
+        prefs_js = os.path.join(self.source, 'prefs.js')
+        st = os.stat(prefs_js)
+        f = file(prefs_js, 'w')
+        f.write('user_pref("browser.shell.checkDefaultBrowser", true );\n')
+        f.close()
+        os.utime(prefs_js, (st.st_atime, st.st_mtime))
+        self.assertEqual(os.path.getsize(prefs_js), st.st_size)
+        self.assertNotEqual(self.ffsetup.CachedProfile(self.source, {}, [], 'localhost')[0], updated)
+
+    def test_run_cache(self):
+        """test that the profile cache defaults to the directory of the run"""
+
+        ffsetup = FFSetup(None)
+        cache = ffsetup.ProfileCache()
+        self.assertEqual(os.path.dirname(cache), ffsetup_module.run_directory())
+        cached = ffsetup.CachedProfile(self.source, {}, [], 'localhost')[0]
+        self.assertTrue(cached.startswith(cache + os.sep))
+
+        ffsetup.cache_profiles = False
+        self.assertEqual(ffsetup.ProfileCache(), None)
+        temp_dir, profile_dir = ffsetup.CreateTempProfileDir(self.source, {}, [], 'localhost')
+        try:
+            self.assertEqual(ffsetup.profile_entry, None)
+            self.assertTrue(os.path.isfile(os.path.join(profile_dir, 'prefs.js')))
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_warmed_profile(self):
+        """test that an initialized profile is reused without launching the browser"""
+
+        browser_path = os.path.join(self.tempdir, 'firefox')
+        f = file(browser_path, 'w')
+        f.write('#!/bin/sh\n')
+        f.close()
+        browser_config = {'browser_path': browser_path,
+                          'extra_args': '',
+                          'init_url': 'getInfo.html'}
+
+        temp_dir, profile_dir = self.ffsetup.CreateTempProfileDir(self.source, {}, [], 'localhost')
+        warm_dir = self.ffsetup.WarmedProfile(browser_config)
+        self.assertFalse(os.path.exists(warm_dir))
+        # initialized profiles are only kept for the run
+        self.assertTrue(warm_dir.startswith(ffsetup_module.run_directory() + os.sep))
+
+        # as left by the initialization run
+        file(os.path.join(profile_dir, 'times.json'), 'w').close()
+        os.symlink('127.0.0.1:+1234', os.path.join(profile_dir, 'lock'))
+        os.makedirs(os.path.join(profile_dir, 'startupCache'))
+        extensions_ini = '[ExtensionDirs]\nExtension0=%s\n' % \
+            os.path.join(profile_dir, 'extensions', 'pageloader@mozilla.org')
+        f = file(os.path.join(profile_dir, 'extensions.ini'), 'w')
+        f.write(extensions_ini)
+        f.close()
+        self.ffsetup.SaveWarmedProfile(warm_dir, profile_dir,
+                                       {'browser_name': 'Firefox', 'buildid': '20121015'})
+        shutil.rmtree(temp_dir)
+
+        # the next copy is made at the same path, so the paths recorded
+        # by the browser hold
+        warm_profile_dir = profile_dir
+        temp_dir, profile_dir = self.ffsetup.CreateTempProfileDir(self.source, {}, [], 'localhost')
+        self.assertEqual(profile_dir, warm_profile_dir)
+        try:
+            self.assertEqual(self.ffsetup.WarmedProfile(browser_config), warm_dir)
+            # there's no ffprocess to launch the browser with
+            self.assertEqual(self.ffsetup.InitializeNewProfile(profile_dir, browser_config), 1)
+            self.assertEqual(browser_config['browser_name'], 'Firefox')
+            self.assertEqual(browser_config['buildid'], '20121015')
+            self.assertTrue(os.path.isfile(os.path.join(profile_dir, 'times.json')))
+            self.assertFalse(os.path.lexists(os.path.join(profile_dir, 'lock')))
+            # the startup caches are kept
+            self.assertTrue(os.path.isdir(os.path.join(profile_dir, 'startupCache')))
+            self.assertEqual(file(os.path.join(profile_dir, 'extensions.ini')).read(), extensions_ini)
+        finally:
+            shutil.rmtree(temp_dir)
+
+        # a different build doesn't use it
+        f = file(browser_path, 'a')
+        f.write('exit 0\n')
+        f.close()
+        os.utime(browser_path, (0, 0))
+        self.assertNotEqual(self.ffsetup.WarmedProfile(browser_config), warm_dir)
+
+install_rdf = """<?xml version="1.0"?>
+<RDF xmlns="http://www.w3.org/1999/02/22-rdf-syntax-ns#"
+     xmlns:em="http://www.mozilla.org/2004/em-rdf#">
+  <Description about="urn:mozilla:install-manifest">
+    <em:id>%s</em:id>
+    <em:unpack>%s</em:unpack>
+    <em:targetApplication>
+      <Description>
+        <em:id>{ec8030f7-c20a-464f-9b0e-13a3a9e97384}</em:id>
+      </Description>
+    </em:targetApplication>
+  </Description>
+</RDF>
+"""
+
+class TestInstallAddon(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.profile = os.path.join(self.tempdir, 'profile')
+        os.makedirs(os.path.join(self.profile, 'extensions', 'staged'))
+        self.ffsetup = FFSetup(None)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def xpi(self, addon_id, unpack):
+        path = os.path.join(self.tempdir, '%s.xpi' % addon_id.split('@')[0])
+        xpi = zipfile.ZipFile(path, 'w')
+        xpi.writestr('install.rdf', install_rdf % (addon_id, unpack))
+        xpi.writestr('chrome/content/overlay.js', '// %s\n' % addon_id)
+        xpi.close()
+        return path
+
+    def test_install(self):
+        """test installing packed and unpacked extensions together"""
+
+        extensions = [self.xpi('pageloader@mozilla.org', 'true'),
+                      self.xpi('talos-powers@mozilla.org', 'false')]
+        addon_ids = self.ffsetup.PrepareProfile(self.profile, {}, extensions, 'localhost')
+        self.assertEqual(addon_ids, ['pageloader@mozilla.org', 'talos-powers@mozilla.org'])
+
+        staged = os.path.join(self.profile, 'extensions', 'staged')
+        self.assertEqual(sorted(os.listdir(staged)),
+                         ['pageloader@mozilla.org', 'talos-powers@mozilla.org.xpi'])
+        overlay = os.path.join(staged, 'pageloader@mozilla.org', 'chrome', 'content', 'overlay.js')
+        self.assertEqual(file(overlay).read(), '// pageloader@mozilla.org\n')
+
+    def test_install_serial(self):
+        """test installing extensions one at a time"""
+
+        extensions = [self.xpi('pageloader@mozilla.org', 'true'),
+                      self.xpi('talos-powers@mozilla.org', 'false')]
+        self.ffsetup.install_threads = 1
+        addon_ids = self.ffsetup.PrepareProfile(self.profile, {}, extensions, 'localhost')
+        self.assertEqual(addon_ids, ['pageloader@mozilla.org', 'talos-powers@mozilla.org'])
+
+    def test_metadata_cache(self):
+        """test that install.rdf is only parsed once per xpi"""
+
+        xpi = self.xpi('pageloader@mozilla.org', 'true')
+        self.assertEqual(self.ffsetup.addon_metadata(xpi), ('pageloader@mozilla.org', True))
+
+        parseString = minidom.parseString
+        def fail(*args):
+            raise AssertionError("install.rdf parsed again")
+        minidom.parseString = fail
+        try:
+            self.assertEqual(FFSetup(None).addon_metadata(xpi), ('pageloader@mozilla.org', True))
+        finally:
+            minidom.parseString = parseString
+
+if __name__ == '__main__':
+    unittest.main()
@@ -12,6 +12,7 @@ import tempfile
 import time
 import unittest
 import talos.filter
+from random import Random
 from talos.PerfConfigurator import PerfConfigurator
 
 class TestFilter(unittest.TestCase):
@@ -78,5 +79,155 @@ class TestFilter(unittest.TestCase):
         # delete foo again
         del talos.filter.scalar_filters['foo']
 
+    def test_apply_batch(self):
+        """test that batched filtering matches filtering each series"""
+
+        series = [[74., 65., 68., 66., 62.],
+                  [43., 44., 35., 41., 41.],
+                  [71836., 15057., 15063., 57436., 15061.],
+                  [5050., 5054., 5053., 5054., 5055.]]
+        chains = [[talos.filter.median],
+                  [[talos.filter.ignore_first, [2]], [talos.filter.median]],
+                  [talos.filter.ignore_max, talos.filter.mean],
+                  [talos.filter.ignore_min, talos.filter.ignore_max, max],
+                  [talos.filter.ignore_max, talos.filter.variance],
+                  [talos.filter.ignore_first, talos.filter.stddev],
+                  [talos.filter.dromaeo],
+                  [[talos.filter.ignore_first, [10]], min],
+                  [talos.filter.percentile],
+                  [[talos.filter.percentile, [50]]],
+                  [talos.filter.ignore_max, [talos.filter.percentile, [10]]],
+                  [[talos.filter.trimmed_mean, [20]]],
+                  [talos.filter.ignore_first, talos.filter.trimmed_mean]]
+
+        numpy = talos.filter.numpy
+        try:
+            for backend in (numpy, None):
+                talos.filter.numpy = backend
+                for filters in chains:
+                    expected = [talos.filter.apply(data, filters) for data in series]
+                    self.assertEqual(talos.filter.apply_batch(series, filters), expected)
+
+                # series of unequal length are filtered one at a time
+                ragged = series + [[1., 2., 3.]]
+                filters = [talos.filter.ignore_max, talos.filter.median]
+                expected = [talos.filter.apply(data, filters) for data in ragged]
+                self.assertEqual(talos.filter.apply_batch(ragged, filters), expected)
+        finally:
+            talos.filter.numpy = numpy
+
+    def test_apply_batch_random(self):
+        """test that every batched filter matches filtering each series on random data"""
+
+        if talos.filter.numpy is None:
+            self.skipTest("numpy is not installed")
+        random = Random(1234)
+        args = {talos.filter.percentile: [[], [10], [50], [99]],
+                talos.filter.trimmed_mean: [[], [20], [45]],
+                talos.filter.ignore_first: [[], [3]]}
+        for length in range(1, 12):
+            series = [[random.uniform(-1, 1) * 10**random.randint(-3, 6) for i in range(length)]
+                      for j in range(20)]
+            for f in talos.filter.batch_filters:
+                for f_args in args.get(f, [[]]):
+                    filters = [[f, f_args]]
+                    expected = [talos.filter.apply(data, filters) for data in series]
+                    self.assertEqual(talos.filter.apply_batch(series, filters), expected,
+                                     "%s%s on %d data points" % (f.__name__, f_args, length))
+
+    def test_order_statistics(self):
+        """test the percentile and trimmed_mean filters"""
+
+        data = [15., 20., 35., 40., 50.]
+        self.assertEqual(talos.filter.percentile(data, 0), 15.)
+        self.assertEqual(talos.filter.percentile(data, 50), talos.filter.median(data))
+        self.assertEqual(talos.filter.percentile(data, 100), 50.)
+        self.assertAlmostEqual(talos.filter.percentile(data, 95), 48.)
+        self.assertAlmostEqual(talos.filter.percentile(data[:-1], 50), 27.5)
+        self.assertEqual(talos.filter.percentile([3.], 95), 3.)
+
+        self.assertEqual(talos.filter.trimmed_mean(data, 0), talos.filter.mean(data))
+        self.assertEqual(talos.filter.trimmed_mean(data, 20), talos.filter.mean([20., 35., 40.]))
+        self.assertEqual(talos.filter.trimmed_mean(data, 10), talos.filter.mean(data)) # nothing to trim
+
+        # they are reducers accessible from configuration
+        self.assertEqual(talos.filter.parse('percentile:95'), ['percentile', [95]])
+        filters = talos.filter.filters_args([['ignore_max', []], ['percentile', [95]]])
+        self.assertAlmostEqual(talos.filter.apply(data, filters), 39.25)
+
+    def test_pipeline(self):
+        """test compiling a filter chain"""
+
+        data = [74., 65., 68., 66., 62., 71., 80., 0., -1.]
+        specs = [[['median', []]],
+                 [['ignore_first', [2]], ['ignore_max', []], ['mean', []]],
+                 [['ignore_max', []], ['ignore_max', []], ['ignore_min', []], ['max', []]],
+                 [['ignore_first', [10]], ['ignore_max', []], ['median', []]],
+                 [['ignore_first', [0]], ['ignore_first', []], ['percentile', [95]]],
+                 [['ignore_min', []], ['ignore_max', []], ['min', []]]]
+        for spec in specs:
+            pipeline = talos.filter.pipeline(spec)
+            expected = talos.filter.apply(data, talos.filter.filters_args(spec))
+            self.assertEqual(pipeline(data), expected)
+            self.assertEqual(talos.filter.apply(data, pipeline), expected)
+            self.assertEqual(talos.filter.apply_batch([data, data], pipeline), [expected, expected])
+
+            # the pipeline is cached by spec
+            self.assertTrue(talos.filter.pipeline([i[:] for i in spec]) is pipeline)
+
+        # the series filters are fused into one step
+        pipeline = talos.filter.pipeline(specs[1])
+        self.assertEqual(len(pipeline), 2)
+        self.assertTrue(isinstance(pipeline[0][0], talos.filter.SeriesSelection))
+        self.assertTrue(pipeline[-1][0] is talos.filter.mean)
+
+        # the data is not modified
+        self.assertEqual(data, [74., 65., 68., 66., 62., 71., 80., 0., -1.])
+
+        # bad chains are rejected
+        self.assertRaises(AssertionError, talos.filter.pipeline, [['median', []], ['ignore_max', []]])
+        self.assertRaises(AssertionError, talos.filter.pipeline, [['nonesuch', []]])
+
+    def test_bootstrap(self):
+        """test the bootstrap reducers"""
+
+        data = [74., 65., 68., 66., 62., 71., 80., 69., 64., 70.]
+        numpy = talos.filter.numpy
+        intervals = {} # backend -> intervals
+        try:
+            for backend in (numpy, None):
+                talos.filter.numpy = backend
+                for reducer, function in ((talos.filter.bootstrap_median, talos.filter.median),
+                                          (talos.filter.bootstrap_mean, talos.filter.mean)):
+                    estimate = reducer(data)
+                    intervals.setdefault(backend, []).append((estimate.low, estimate.high))
+                    self.assertTrue(isinstance(estimate, talos.filter.Estimate))
+                    self.assertEqual(estimate, function(data))
+                    self.assertTrue(min(data) <= estimate.low <= estimate <= estimate.high <= max(data))
+
+                    # resampling is reproducible
+                    again = reducer(data)
+                    self.assertEqual((again.low, again.high), (estimate.low, estimate.high))
+
+                    # a wider confidence gives a wider interval
+                    wider = reducer(data, 99)
+                    self.assertTrue(wider.low <= estimate.low and estimate.high <= wider.high)
+
+                # may be used as the last of a filter chain
+                filters = talos.filter.pipeline([['ignore_max', []], ['bootstrap_median', [90, 200]]])
+                estimate = talos.filter.apply(data, filters)
+                self.assertEqual(estimate, talos.filter.median(talos.filter.ignore_max(data)))
+                self.assertTrue(estimate.low < estimate.high)
+
+                # reducers taking arguments are bootstrapped with them
+                estimate = talos.filter.estimate(data, [[talos.filter.percentile, [90]]])
+                self.assertEqual(estimate, talos.filter.percentile(data, 90))
+                intervals[backend].append((estimate.low, estimate.high))
+        finally:
+            talos.filter.numpy = numpy
+
+        # the intervals don't depend on whether numpy is installed
+        self.assertEqual(intervals[numpy], intervals[None])
+
 if __name__ == '__main__':
     unittest.main()
@@ -63,5 +63,42 @@ class TalosProcess(unittest.TestCase):
         self.assertTrue(len(processes))
         self.assertTrue(pid in [i[0] for i in processes])
 
+    def test_proc_table(self):
+        """the /proc process table matches the output of ps"""
+        if not talos.utils.proc_table:
+            return
+
+        command = [sys.executable, '-c', 'import time; time.sleep(3)']
+        process = subprocess.Popen(command)
+        pid = str(process.pid)
+        try:
+            proc_table = talos.utils.ps()
+            # the table is kept as ps output for diagnostics
+            listed = talos.utils._parse_ps(talos.utils._ps_output)
+            talos.utils.proc_table = False
+            try:
+                ps_table = talos.utils.ps()
+            finally:
+                talos.utils.proc_table = True
+        finally:
+            process.kill()
+            process.wait()
+
+        proc_line = [i for i in proc_table if i['PID'] == pid]
+        ps_line = [i for i in ps_table if i['PID'] == pid]
+        self.assertEqual(len(proc_line), 1)
+        self.assertEqual(len(ps_line), 1)
+        self.assertEqual(proc_line[0]['COMMAND'], ps_line[0]['COMMAND'])
+        self.assertEqual([i['PID'] for i in listed], [i['PID'] for i in proc_table])
+        self.assertEqual([i for i in listed if i['PID'] == pid], proc_line)
+        # the state may change between the two reads
+        self.assertEqual(len(proc_line[0]['STAT']), 1)
+
+    def test_ttl(self):
+        """process tables are shared within the ttl"""
+        table = talos.utils.ps(ttl=60)
+        self.assertTrue(talos.utils.ps(ttl=60) is table)
+        self.assertFalse(talos.utils.ps() is table)
+
 if __name__ == '__main__':
     unittest.main()
@@ -28,6 +28,8 @@ _x_x_mozilla_page_load_details
 |11;hixie-007.xml;1628;1623;1623;1617;1622
 """
 
+import os
+import tempfile
 import unittest
 import talos.filter
 import talos.results
@@ -56,6 +58,21 @@ class TestPageloaderResults(unittest.TestCase):
         first = [74., 65., 68., 66., 62.]
         self.assertEqual(results.results[0]['runs'], first)
 
+    def test_table(self):
+        """test the columnar store behind the results"""
+        results = talos.results.PageloaderResults(results_string)
+        table = results.table
+        self.assertEqual(len(table), 12)
+        self.assertEqual(len(table.runs), 60)
+        self.assertEqual(list(table.offsets), range(0, 65, 5))
+        self.assertEqual(list(table.indices), range(12))
+        self.assertTrue(table.pages[5] is intern('hixie-001.xml'))
+        self.assertFalse(hasattr(results, '__dict__'))
+
+        # the list of dicts view is consistent with it
+        self.assertEqual(results.raw_values(),
+                         [(result['page'], result['runs']) for result in results.results])
+
     def test_filter(self):
         """test PageloaderResults.filter function"""
 
@@ -78,5 +95,123 @@ class TestPageloaderResults(unittest.TestCase):
         self.assertEqual(filtered[0][0], 68.)
         self.assertEqual(filtered[-1][0], 1623.)
 
+    def test_values(self):
+        """test that the values of the same filters are only computed once"""
+
+        results = talos.results.PageloaderResults(results_string)
+        pipeline = talos.filter.pipeline([['ignore_max', []], ['bootstrap_median', [95, 100]]])
+        values = results.values(pipeline)
+        self.assertTrue(isinstance(values[0][0], talos.filter.Estimate))
+
+        def fail(self, *filters):
+            raise AssertionError("values filtered again")
+        _filter = talos.results.Results.filter
+        talos.results.Results.filter = fail
+        try:
+            self.assertEqual(results.values(pipeline), values)
+            self.assertEqual(results.values(list(pipeline)), values)
+            self.assertRaises(AssertionError, results.values, [talos.filter.median])
+        finally:
+            talos.results.Results.filter = _filter
+
+class TestTsResults(unittest.TestCase):
+
+    def test_parsing(self):
+        """test parsing both Ts formats"""
+
+        results = talos.results.TsResults('392|401| 388\n')
+        self.assertEqual(results.raw_values(), [('NULL', [392., 401., 388.])])
+
+        results = talos.results.TsResults('tresize,12.5,,13.25\ntsvgr_opacity,60,58\n')
+        self.assertEqual(results.raw_values(), [('tresize', [12.5, 13.25]),
+                                                ('tsvgr_opacity', [60., 58.])])
+        self.assertEqual([result['index'] for result in results.results], [0, 1])
+
+        self.assertRaises(ValueError, talos.results.TsResults, '392|40x1')
+
+    def test_parse_floats(self):
+        """test converting runs in bulk"""
+        fields = ['1 ', ' 2', '3.5e2', '-4', '+5', '.5']
+        self.assertEqual(talos.results.parse_floats(fields).tolist(),
+                         [float(i) for i in fields])
+        self.assertEqual(talos.results.parse_floats([]).tolist(), [])
+        self.assertRaises(ValueError, talos.results.parse_floats, ['1', '1,5'])
+
+class TestTestResults(unittest.TestCase):
+
+    def test_converged(self):
+        """test estimating whether results across cycles have converged"""
+
+        filters = talos.filter.pipeline([['ignore_max', []], ['median', []]])
+        test_results = talos.results.TestResults({'name': 'ts'})
+        self.assertFalse(test_results.converged(filters, 0.05))
+
+        # a few noisy cycles
+        for value in (392, 510, 401, 288):
+            test_results.add(talos.results.TsResults(str(value)))
+        self.assertFalse(test_results.converged(filters, 0.05))
+
+        # many steady cycles
+        for value in [400, 401, 399, 400, 402, 398] * 3:
+            test_results.add(talos.results.TsResults(str(value)))
+        self.assertTrue(test_results.converged(filters, 0.05))
+
+        # each page is estimated separately
+        estimates = test_results.estimates(filters)
+        self.assertEqual(len(estimates), 1)
+        value, page = estimates[0]
+        self.assertEqual(page, 'NULL')
+        self.assertEqual(value, 400.)
+        self.assertTrue(value.low <= value <= value.high)
+
+    def test_in_flight(self):
+        """test parsing a cycle's browser log while it is written"""
+
+        log = '__start_tp_report' + results_string + """__end_tp_report
+__startTimestamp1333663595953__endTimestamp
+__startBeforeLaunchTimestamp1333663595557__endBeforeLaunchTimestamp
+__startAfterTerminationTimestamp1333663596551__endAfterTerminationTimestamp
+"""
+        filename = tempfile.mktemp()
+        f = file(filename, 'w')
+        f.write(log)
+        f.close()
+        try:
+            test_results = talos.results.TestResults({'name': 'tsvg'})
+            test_results.start_cycle()
+            self.assertEqual(test_results.partial_values(), [])
+
+            # up to part way through the row for hixie-001.xml
+            split = log.index('15057')
+            test_results.scan(log[:split])
+            partial = test_results.partial_values()
+            self.assertEqual([page for page, runs in partial][-1], 'composite-scale-rotate-opacity.svg')
+            self.assertEqual(partial[0], ('gearflowers.svg', [74., 65., 68., 66., 62.]))
+            self.assertEqual(test_results.failure(), None)
+
+            test_results.scan(log[split:])
+            self.assertEqual(len(test_results.partial_values()), 12)
+
+            # the log isn't read again
+            os.remove(filename)
+            file(filename, 'w').close()
+            test_results.add(filename)
+            self.assertEqual(test_results.scanner, None)
+            self.assertEqual(len(test_results.results), 1)
+            self.assertEqual(test_results.results[0].raw_values(),
+                             talos.results.PageloaderResults(results_string).raw_values())
+        finally:
+            os.remove(filename)
+
+    def test_failure(self):
+        """test finding a failure in a cycle's browser log while it is written"""
+
+        test_results = talos.results.TestResults({'name': 'ts'})
+        test_results.start_cycle()
+        test_results.scan('__FAILTimeout in tsvg__FA')
+        self.assertEqual(test_results.failure(), None)
+        test_results.scan('IL\n')
+        self.assertEqual(test_results.failure(), 'Timeout in tsvg')
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+
+"""
+Tests for talos.ttest
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from talos import utils
+from talos.ffprocess import FFProcess
+from talos.ttest import TTest
+
+# writes a failure to the browser log and hangs, as a browser would
+# with browser_controller waiting on it
+failing_browser = """
+f = open(%r, 'w')
+f.write('__FAILbrowser crashed__FAIL\\n')
+f.close()
+import time
+time.sleep(60)
+"""
+
+class FakeProcess(FFProcess):
+    """a browser that only exists while its controller has been launched"""
+
+    def __init__(self):
+        self.running = False
+        self.cleanups = [] # callers of cleanupProcesses
+
+    def ProcessesWithNames(self, *process_names):
+        if self.running:
+            return [(1234, 'firefox')]
+        return []
+
+    def cleanupProcesses(self, process_name, child_process, browser_wait):
+        self.cleanups.append(sys._getframe(1).f_code.co_name)
+        self.running = False
+        return ''
+
+    def GenerateBrowserCommandLine(self, browser_path, extra_args, deviceroot, profile_dir, url):
+        return '%s -profile %s %s' % (browser_path, profile_dir, url)
+
+    def GenerateBControllerCommandLine(self, command_line, browser_config, test_config):
+        self.running = True
+        return [sys.executable, '-c', failing_browser % browser_config['browser_log']]
+
+class FakeSetup(object):
+
+    extensions = []
+
+    def __init__(self, tempdir):
+        self.tempdir = tempdir
+
+    def CreateTempProfileDir(self, source_profile, prefs, extensions, webserver):
+        temp_dir = tempfile.mkdtemp(dir=self.tempdir)
+        profile_dir = os.path.join(temp_dir, 'profile')
+        os.mkdir(profile_dir)
+        return temp_dir, profile_dir
+
+    def InitializeNewProfile(self, profile_dir, browser_config):
+        return 1
+
+class TestRunTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.ttest = TTest.__new__(TTest)
+        self.ttest._ffprocess = self.ttest._hostproc = FakeProcess()
+        self.ttest._ffsetup = FakeSetup(self.tempdir)
+        self.ttest.remote = False
+        self.browser_config = {'remote': False,
+                               'process': 'firefox',
+                               'child_process': 'plugin-container',
+                               'browser_path': os.path.join(self.tempdir, 'firefox'),
+                               'browser_wait': 1,
+                               'browser_log': os.path.join(self.tempdir, 'browser_output.txt'),
+                               'error_filename': os.path.join(self.tempdir, 'error.txt'),
+                               'deviceroot': '',
+                               'extra_args': '',
+                               'env': {},
+                               'symbols_path': None,
+                               'dirs': {},
+                               'preferences': {},
+                               'extensions': [],
+                               'webserver': 'localhost',
+                               'fennecIDs': ''}
+        self.test_config = {'name': 'tfail',
+                            'url': 'tfail.html',
+                            'cycles': 3,
+                            'resolution': 0.1,
+                            'timeout': 30,
+                            'shutdown': False,
+                            'profile_path': os.path.join(self.tempdir, 'base_profile')}
+
+    def tearDown(self):
+        utils.restoreEnvironmentVars()
+        shutil.rmtree(self.tempdir)
+
+    def test_early_failure(self):
+        """test that a failure reported during a cycle stops the browser"""
+
+        try:
+            self.ttest.runTest(self.browser_config, self.test_config)
+        except utils.talosError, e:
+            self.assertTrue('browser crashed' in str(e))
+        else:
+            self.fail("the failure was not raised")
+
+        # the browser is terminated by the test itself, not only by the
+        # cleanup after the failure
+        self.assertEqual(self.ttest._ffprocess.cleanups[0], 'runTest')
+        self.assertFalse(self.ttest._ffprocess.running)
+
+if __name__ == '__main__':
+    unittest.main()
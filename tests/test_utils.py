@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+
+"""
+Tests for talos.utils
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+from talos import utils
+
+class TestZipExtractall(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.zip = os.path.join(self.tempdir, 'pageset.zip')
+        self.members = {'page_load_test/tp5n/index.html': '<html></html>\n',
+                        'page_load_test/tp5n/style.css': 'body { color: red }\n' * 1000,
+                        'page_load_test/tp5n/empty.txt': '',
+                        'page_load_test/tp5n/images/logo.png': os.urandom(100000)}
+        z = zipfile.ZipFile(self.zip, 'w', zipfile.ZIP_DEFLATED)
+        z.writestr('page_load_test/tp5n/images/', '')
+        for name, data in self.members.items():
+            z.writestr(name, data)
+        z.close()
+        self.dest = os.path.join(self.tempdir, 'dest')
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def check(self):
+        for name, data in self.members.items():
+            self.assertEqual(file(os.path.join(self.dest, name), 'rb').read(), data)
+
+    def test_extract(self):
+        """test extracting in small chunks"""
+        utils.zip_extractall(zipfile.ZipFile(self.zip), self.dest, chunk_size=1024)
+        self.check()
+
+    def test_threads(self):
+        """test extracting on several threads"""
+        utils.zip_extractall(zipfile.ZipFile(self.zip), self.dest, threads=3)
+        self.check()
+
+    def test_no_open(self):
+        """test extracting from a ZipFile without open(), as before python 2.6"""
+        class OldZipFile(object):
+            def __init__(self, filename):
+                self._zip = zipfile.ZipFile(filename)
+                self.filename = filename
+                self.infolist = self._zip.infolist
+                self.read = self._zip.read
+        utils.zip_extractall(OldZipFile(self.zip), self.dest)
+        self.check()
+
+    def test_unchanged(self):
+        """test that only members which differ on disk are written"""
+        utils.zip_extractall(zipfile.ZipFile(self.zip), self.dest)
+        changed = os.path.join(self.dest, 'page_load_test/tp5n/index.html')
+        f = file(changed, 'w')
+        f.write('<html>!</html>\n') # same size, different CRC
+        f.close()
+        unchanged = os.path.join(self.dest, 'page_load_test/tp5n/style.css')
+        os.utime(unchanged, (0, 0))
+        os.utime(changed, (0, 0))
+
+        utils.zip_extractall(zipfile.ZipFile(self.zip), self.dest)
+        self.check()
+        self.assertEqual(os.path.getmtime(unchanged), 0)
+        self.assertNotEqual(os.path.getmtime(changed), 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+
+"""
+test talos' event-driven waits:
+
+http://hg.mozilla.org/build/talos/file/tip/talos/wait.py
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+from talos import wait
+
+class TestWaiter(unittest.TestCase):
+
+    def test_fallback(self):
+        """with nothing to watch, wait sleeps for the timeout"""
+        waiter = wait.Waiter()
+        start = time.time()
+        self.assertFalse(waiter.wait(0.1))
+        self.assertTrue(time.time() - start >= 0.1)
+
+    def test_until(self):
+        """wait for a condition with an upper bound"""
+        values = [None, 0, 'ready']
+        self.assertEqual(wait.until(lambda: values.pop(0), 10, interval=0.01), 'ready')
+        self.assertEqual(values, [])
+
+        start = time.time()
+        self.assertEqual(wait.until(lambda: [], 0.1, interval=0.01), [])
+        self.assertTrue(time.time() - start >= 0.1)
+
+    def test_watch_file(self):
+        """wake on writes to the watched file only"""
+        if wait.libc is None:
+            return
+        tempdir = tempfile.mkdtemp()
+        try:
+            waiter = wait.Waiter()
+            log = os.path.join(tempdir, 'browser_output.txt')
+            self.assertTrue(waiter.watch_file(log))
+
+            # writes to other files in the directory are ignored
+            file(os.path.join(tempdir, 'other.txt'), 'w').write('foo')
+            self.assertFalse(waiter.wait(0.1))
+
+            file(log, 'w').write('__start_report')
+            start = time.time()
+            self.assertTrue(waiter.wait(10))
+            self.assertTrue(time.time() - start < 5)
+            waiter.close()
+        finally:
+            shutil.rmtree(tempdir)
+
+    def test_watch_process(self):
+        """wake when a child process exits"""
+        if wait.libc is None:
+            return
+        process = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(0.2)'])
+        waiter = wait.Waiter()
+        if not waiter.watch_process(process.pid):
+            # kernel without pidfd_open
+            process.wait()
+            return
+        start = time.time()
+        self.assertTrue(waiter.wait(10))
+        self.assertTrue(time.time() - start < 5)
+        self.assertEqual(process.wait(), 0)
+        waiter.close()
+
+    def test_pipe(self):
+        """wake when the pipe is written to"""
+        waiter = wait.Waiter()
+        fd = waiter.pipe()
+        if fd is None:
+            return
+        self.assertFalse(waiter.wait(0.1))
+        os.write(fd, '.')
+        os.close(fd)
+        self.assertTrue(waiter.wait(10))
+        waiter.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,10 +5,12 @@ Tests for talos.xrestop
 """
 
 import os
+import stat
 import subprocess
 import sys
+import tempfile
 import unittest
-from talos.cmanager_linux import xrestop
+from talos.cmanager_linux import xrestop, XrestopParser, XrestopReader
 
 here = os.path.dirname(os.path.abspath(__file__))
 xrestop_output = os.path.join(here, 'xrestop_output.txt')
@@ -58,5 +60,43 @@ class TestXrestop(unittest.TestCase):
         # cleanup: set subprocess.Popen back
         subprocess.Popen = Popen
 
+    def test_frames(self):
+        """test that the batch mode parser splits output into frames"""
+
+        lines = file(xrestop_output).read().splitlines()
+        parser = XrestopParser()
+        new_frames = [parser.feed(line) for line in lines]
+        self.assertFalse(True in new_frames)
+        self.assertEqual(parser.frame, None)
+        self.assertEqual(len(parser.clients), 7)
+
+        # the second frame starts back at index 0
+        new_frames = [parser.feed(line) for line in lines]
+        self.assertEqual(new_frames.count(True), 1)
+        self.assertTrue(new_frames[0])
+        self.assertEqual(len(parser.frame), 7)
+        self.assertEqual(parser.frame[2035]['total bytes'], '~4728761')
+        self.assertEqual(parser.frame, parser.clients)
+        self.assertFalse(parser.frame is parser.clients)
+
+    def test_reader(self):
+        """test reading frames from a running xrestop"""
+
+        fd, script = tempfile.mkstemp()
+        # only print frames when run in batch mode with a 2 second delay
+        os.write(fd, '#!/bin/sh\n[ "$*" = "-b -t 2" ] || exit 1\ncat "%s" "%s"\n' %
+                 (xrestop_output, xrestop_output))
+        os.close(fd)
+        os.chmod(script, stat.S_IRWXU)
+        try:
+            reader = XrestopReader(binary=script, delay=2)
+            reader.thread.join(10)
+            output = reader.clients(timeout=0)
+            self.assertEqual(len(output), 7)
+            self.assertEqual(output[1668]['pixmap bytes'], '1943716')
+            reader.stop()
+        finally:
+            os.remove(script)
+
 if __name__ == '__main__':
     unittest.main()